@@ -22,6 +22,14 @@ warnings.filterwarnings('ignore')
 # 使用相对于项目根目录的路径
 PROJECT_ROOT = Path(__file__).resolve().parents[2]
 
+def read_table(csv_path: Path) -> pd.DataFrame:
+    """Read a processed table, preferring its Parquet sibling when it is at least as new as the CSV."""
+    parquet_path = csv_path.with_suffix('.parquet')
+    if parquet_path.exists() and (not csv_path.exists()
+                                  or parquet_path.stat().st_mtime >= csv_path.stat().st_mtime):
+        return pd.read_parquet(parquet_path)
+    return pd.read_csv(csv_path)
+
 def aggregate_population_to_total(pop_df: pd.DataFrame) -> pd.DataFrame:
     """Aggregate the detailed population structure to get total population by county-year."""
     print("Aggregating population data...")
@@ -97,19 +105,19 @@ def load_all_processed_data() -> pd.DataFrame:
     
     # Population Data (aggregate to total)
     try:
-        population_df = pd.read_csv(processed_socio / "Population_Structure.csv")
+        population_df = read_table(processed_socio / "Population_Structure.csv")
         population_df['COUNTY_FIPS'] = population_df['COUNTY_FIPS'].astype(str).str.zfill(5)
         total_pop_df = aggregate_population_to_total(population_df)
         master_df = master_df.merge(total_pop_df, on=['COUNTY_FIPS', 'Year'], how='left')
     except FileNotFoundError:
-        print("  Warning: Population_Structure.csv not found")
+        print("  Warning: Population_Structure.parquet/.csv not found")
     
     # 4. Load Environmental Data
     print("Loading environmental data...")
     
     # NLDAS Climate Data
     try:
-        nldas_df = pd.read_csv(processed_env / "NLDAS.csv")
+        nldas_df = read_table(processed_env / "NLDAS.csv")
         nldas_df['COUNTY_FIPS'] = nldas_df['COUNTY_FIPS'].astype(str).str.zfill(5)
         # Select only the climate variables we need for PCA based on user preference
         climate_vars = [
@@ -138,7 +146,7 @@ def load_all_processed_data() -> pd.DataFrame:
         master_df = master_df.merge(nldas_subset, on=['COUNTY_FIPS', 'Year'], how='left')
         
     except FileNotFoundError:
-        print("  Warning: NLDAS.csv not found")
+        print("  Warning: NLDAS.parquet/.csv not found")
     
     # Add location information
     print("Adding location information...")
@@ -13,18 +13,37 @@ import numpy as np
 import pandas as pd
 import xarray as xr
 import geopandas as gpd
-from shapely.geometry import Point, Polygon
-from scipy.sparse import csr_matrix
+import shapely
+from shapely.geometry import Polygon
+from shapely.strtree import STRtree
+from scipy.sparse import csr_matrix, coo_matrix, diags
 import warnings
 import yaml
 warnings.filterwarnings('ignore')
 
+# Optional: numexpr 融合计算相对湿度（未安装时回退到 NumPy）
+try:
+    import numexpr as ne  # type: ignore
+except Exception:  # pragma: no cover
+    ne = None
+
 # ==================== Configuration ====================
 START_YEAR = 1999
 END_YEAR = 2019
 MAX_COUNTIES_FOR_TEST = None
+OUTPUT_FORMAT = 'parquet'  # 'parquet'（pyarrow + zstd）或 'csv'
 # =================================================
 
+# 气象变量（数组最后一维的顺序）与季节定义
+MET_VARS = ['tas', 'wind', 'prcp', 'rh', 'swrad', 'lwrad', 'psurf', 'cape', 'potevap']
+SUM_VARS = ['prcp', 'potevap']  # 累计值，其余变量取平均
+SEASONS = {
+    'DJF': [12, 1, 2],  # 12月取自上一年
+    'MAM': [3, 4, 5],
+    'JJA': [6, 7, 8],
+    'SON': [9, 10, 11]
+}
+
 def load_paths():
     """Loads paths from config.yaml."""
     project_root = Path(__file__).resolve().parents[2]
@@ -134,45 +153,74 @@ def create_spatial_weight_matrix(gdf_albers, nldas_sample_file):
         crs='EPSG:4326'
     ).to_crs('EPSG:5070')
 
-    # 计算县-网格交叠面积
+    # 计算县-网格交叠面积：STRtree筛选候选对，只对相交的县-网格对求交
     print("  计算县-网格交叠面积...")
-    weight_matrix = np.zeros((len(gdf_albers), len(grid_polygons)))
-
-    for county_idx, county_geom in enumerate(gdf_albers.geometry):
-        if county_idx % 50 == 0:
-            print(f"    [{county_idx+1:4d}/{len(gdf_albers)}] 处理县 {county_idx + 1}/{len(gdf_albers)}")
-
-        # 检查县是否有有效几何
-        if county_geom is None or county_geom.is_empty:
-            continue
+    county_geoms = np.asarray(gdf_albers.geometry.values, dtype=object)
+    # 修复无效几何（自相交等），否则单个县会让整批求交抛出 GEOSException
+    invalid = ~shapely.is_valid(county_geoms) & ~shapely.is_missing(county_geoms)
+    if invalid.any():
+        print(f"  修复 {int(invalid.sum())} 个无效县几何")
+        county_geoms[invalid] = shapely.make_valid(county_geoms[invalid])
+    grid_geoms = np.asarray(grid_gdf.geometry.values, dtype=object)
+    tree = STRtree(grid_geoms)
+    county_pos, grid_pos = tree.query(county_geoms, predicate='intersects')
+    print(f"  候选县-网格对: {len(county_pos)}")
 
-        try:
-            # 计算与所有网格的交叠
-            for grid_idx, grid_geom in enumerate(grid_gdf.geometry):
-                if grid_geom is not None and not grid_geom.is_empty:
-                    intersection = county_geom.intersection(grid_geom)
-                    if not intersection.is_empty:
-                        weight_matrix[county_idx, grid_idx] = intersection.area
-        except Exception as e:
-            print(f"    处理县 {county_idx} 时出错: {e}")
-            continue
-
-        # 归一化权重（按县面积）
-        county_area = county_geom.area
-        if county_area > 0:
-            weight_matrix[county_idx, :] /= county_area
+    try:
+        overlap = shapely.area(shapely.intersection(county_geoms[county_pos], grid_geoms[grid_pos]))
+    except shapely.errors.GEOSException as e:
+        # 批量求交失败时逐县计算，跳过仍然出错的县
+        print(f"  批量求交失败，逐县计算: {e}")
+        overlap = np.zeros(len(county_pos), dtype=float)
+        for county_idx in np.unique(county_pos):
+            rows = np.flatnonzero(county_pos == county_idx)
+            try:
+                overlap[rows] = shapely.area(shapely.intersection(county_geoms[county_idx], grid_geoms[grid_pos[rows]]))
+            except shapely.errors.GEOSException as county_error:
+                print(f"    处理县 {county_idx} 时出错: {county_error}")
+    keep = overlap > 0
+    weight_coo = coo_matrix(
+        (overlap[keep], (county_pos[keep], grid_pos[keep])),
+        shape=(len(county_geoms), len(grid_geoms))
+    )
 
     print(f"  完成 {len(gdf_albers)} 个县的权重计算")
 
-    # 转换为稀疏矩阵
-    print("  转换为稀疏矩阵...")
-    weight_sparse = csr_matrix(weight_matrix)
+    # 归一化权重（按县面积）：一次稀疏对角矩阵乘法 D @ W
+    county_areas = np.asarray(
+        [g.area if g is not None and not g.is_empty else 0.0 for g in gdf_albers.geometry],
+        dtype=float
+    )
+    inv_areas = np.divide(1.0, county_areas, out=np.zeros_like(county_areas), where=county_areas > 0)
+    weight_sparse = (diags(inv_areas) @ weight_coo.tocsr()).tocsr()
 
     print(f"  权重矩阵形状: {weight_sparse.shape}")
     print(f"  非零元素: {weight_sparse.nnz}")
 
     return weight_sparse, grid_indices
 
+def compute_relative_humidity(q, t, p):
+    """由比湿(kg/kg)、气温(K)、地表气压(Pa)计算相对湿度(%)
+
+    饱和水汽压使用Magnus公式: es = 611.2 * exp(17.67 * (t - 273.15) / (t - 29.65)) Pa，
+    实际水汽压 e = q * p / (0.622 + 0.378 * q)，结果裁剪到 [0, 100]。
+    安装了 numexpr 时单次遍历完成全部计算，避免逐步生成大尺寸临时数组。
+    """
+    if ne is not None:
+        rh = ne.evaluate(
+            "100.0 * (q * p / (0.622 + q * 0.378)) / (611.2 * exp(17.67 * (t - 273.15) / (t - 29.65)))",
+            local_dict={'q': q, 't': t, 'p': p}
+        )
+    else:
+        t_c = t - 273.15  # 转换为摄氏度
+        # 饱和水汽压 (Magnus公式, hPa -> Pa)
+        es = 6.112 * np.exp(17.67 * t_c / (t_c + 243.5)) * 100
+        # 实际水汽压
+        rh = q * p / (0.622 + q * 0.378)
+        rh /= es
+        rh *= 100
+    return np.clip(rh, 0, 100, out=rh)
+
 def load_nldas_monthly_data(file_path):
     """加载单个月NLDAS数据"""
     try:
@@ -203,13 +251,7 @@ def load_nldas_monthly_data(file_path):
                 p = ds['PSurf'].values[0]  # Pa
 
                 # 计算相对湿度
-                t_c = t - 273.15  # 转换为摄氏度
-                # 饱和水汽压 (Magnus公式)
-                es = 6.112 * np.exp(17.67 * t_c / (t_c + 243.5)) * 100  # hPa -> Pa
-                # 实际水汽压
-                e = q * p / (0.622 + q * 0.378)
-                # 相对湿度
-                data['rh'] = np.clip(e / es * 100, 0, 100)
+                data['rh'] = compute_relative_humidity(q, t, p)
 
             # 短波辐射 (W m-2 -> W/m²)
             if 'SWdown' in ds:
@@ -255,8 +297,35 @@ def aggregate_to_counties(weight_matrix, grid_data, grid_indices):
 
     return county_values
 
+def save_table(df, output_path):
+    """按 OUTPUT_FORMAT 保存结果表，返回实际写出的文件路径"""
+    output_path = Path(output_path)
+    if OUTPUT_FORMAT == 'csv':
+        output_path = output_path.with_suffix('.csv')
+        df.to_csv(output_path, index=False, encoding='utf-8')
+    else:
+        output_path = output_path.with_suffix('.parquet')
+        df.to_parquet(output_path, engine='pyarrow', compression='zstd', index=False)
+    return output_path
+
+def load_monthly_county_array(file_path, weight_matrix, grid_indices, n_counties):
+    """加载单月NLDAS数据并聚合到县级，返回 (n_counties, n_vars) 数组；加载失败返回None"""
+    monthly_data = load_nldas_monthly_data(file_path)
+    if monthly_data is None:
+        return None
+
+    county_array = np.full((n_counties, len(MET_VARS)), np.nan)
+    for var_idx, var_name in enumerate(MET_VARS):
+        if var_name in monthly_data:
+            county_array[:, var_idx] = aggregate_to_counties(weight_matrix, monthly_data[var_name], grid_indices)
+    return county_array
+
 def process_nldas_data_by_year(nldas_files, weight_matrix, grid_indices, gdf, output_folder):
-    """按年份处理NLDAS数据并聚合到县级，每年保存一次"""
+    """按年份处理NLDAS数据并聚合到县级，每年保存一次
+
+    每年的县级月值保存在 (n_counties, 12, n_vars) 数组中，并保留上一年的数组，
+    DJF 直接取上一年12月与当年1、2月，无需复制12月数据行。
+    """
     print("开始按年份处理NLDAS数据...")
 
     # 按年份分组文件，但需要特殊处理起始年的上一年12月数据
@@ -276,81 +345,52 @@ def process_nldas_data_by_year(nldas_files, weight_matrix, grid_indices, gdf, ou
     if prev_year_dec_files:
         print(f"找到起始年前一年12月数据: {len(prev_year_dec_files)} 个文件")
 
+    n_counties = len(gdf)
+    geoids = gdf['GEOID'].to_numpy()
+    array_shape = (n_counties, 12, len(MET_VARS))
+
+    # 上一年的县级月值数组（起始年时只包含前一年12月）
+    prev_array = np.full(array_shape, np.nan)
+    prev_year = START_YEAR - 1
+    for dec_year, dec_month, dec_file_path in prev_year_dec_files:
+        print(f"  [PREV] 处理 {dec_year:04d}-{dec_month:02d}: {os.path.basename(dec_file_path)[:50]}...")
+        county_array = load_monthly_county_array(dec_file_path, weight_matrix, grid_indices, n_counties)
+        if county_array is None:
+            print(f"    跳过 {dec_year:04d}-{dec_month:02d} 由于数据加载失败")
+            continue
+        prev_array[:, dec_month - 1, :] = county_array
+
     all_results = []
 
     for year in sorted(files_by_year.keys()):
         year_files = files_by_year[year]
         print(f"\n处理 {year} 年数据 ({len(year_files)} 个月)...")
 
-        year_results = []
+        # 若上一年整年缺失，DJF 不应使用更早年份的12月
+        if year - 1 != prev_year:
+            prev_array = np.full(array_shape, np.nan)
 
-        # 如果是起始年，需要加入前一年12月的数据用于DJF计算
-        if year == START_YEAR and prev_year_dec_files:
-            print(f"  加入前一年12月数据用于 {year} 年DJF计算...")
-            for prev_year, prev_month, prev_file_path in prev_year_dec_files:
-                print(f"    [PREV] 处理 {prev_year:04d}-{prev_month:02d}: {os.path.basename(prev_file_path)[:50]}...")
-
-                monthly_data = load_nldas_monthly_data(prev_file_path)
-                if monthly_data is None:
-                    print(f"      跳过 {prev_year:04d}-{prev_month:02d} 由于数据加载失败")
-                    continue
-
-                county_data = {}
-                for var_name, grid_data in monthly_data.items():
-                    county_values = aggregate_to_counties(weight_matrix, grid_data, grid_indices)
-                    county_data[var_name] = county_values
-
-                for county_idx in range(len(gdf)):
-                    result_row = {
-                        'GEOID': gdf.iloc[county_idx]['GEOID'],
-                        'year': prev_year,  # 保持原始年份，在统计时会处理
-                        'month': prev_month
-                    }
-
-                    for var_name, values in county_data.items():
-                        result_row[f'{var_name}_{prev_month:02d}'] = values[county_idx]
-
-                    year_results.append(result_row)
-
-        # 处理当年的数据
+        curr_array = np.full(array_shape, np.nan)
         for file_idx, (y, month, file_path) in enumerate(year_files):
             print(f"  [{file_idx+1:2d}/{len(year_files)}] 处理 {y:04d}-{month:02d}: {os.path.basename(file_path)[:50]}...")
 
-            monthly_data = load_nldas_monthly_data(file_path)
-            if monthly_data is None:
+            county_array = load_monthly_county_array(file_path, weight_matrix, grid_indices, n_counties)
+            if county_array is None:
                 print(f"    跳过 {y:04d}-{month:02d} 由于数据加载失败")
                 continue
-
-            county_data = {}
-            for var_name, grid_data in monthly_data.items():
-                county_values = aggregate_to_counties(weight_matrix, grid_data, grid_indices)
-                county_data[var_name] = county_values
-
-            for county_idx in range(len(gdf)):
-                result_row = {
-                    'GEOID': gdf.iloc[county_idx]['GEOID'],
-                    'year': y,
-                    'month': month
-                }
-
-                for var_name, values in county_data.items():
-                    result_row[f'{var_name}_{month:02d}'] = values[county_idx]
-
-                year_results.append(result_row)
+            curr_array[:, month - 1, :] = county_array
 
         # 计算该年的年度和季节统计
         print(f"  计算 {year} 年统计量...")
-        year_df = pd.DataFrame(year_results)
-        annual_df = calculate_annual_seasonal_stats(year_df, target_year=year)
+        annual_df = calculate_annual_seasonal_stats(curr_array, prev_array, geoids, year)
+        prev_array, prev_year = curr_array, year
 
         # 只保存起始年及之后的数据
         if year >= START_YEAR:
             # Rename GEOID to COUNTY_FIPS for consistency with other datasets
             annual_df = annual_df.rename(columns={"GEOID": "COUNTY_FIPS"})
 
-            year_output_file = f"NLDAS_{year}.csv"
-            year_output_path = os.path.join(output_folder, year_output_file)
-            annual_df.to_csv(year_output_path, index=False, encoding='utf-8')
+            year_output_path = save_table(annual_df, Path(output_folder) / f"NLDAS_{year}")
 
             print(f"  {year} 年数据已保存: {year_output_path}")
             print(f"  {year} 年数据形状: {annual_df.shape}")
@@ -369,91 +409,43 @@ def process_nldas_data_by_year(nldas_files, weight_matrix, grid_indices, gdf, ou
         print("处理失败，没有生成数据")
         return pd.DataFrame()
 
-def calculate_annual_seasonal_stats(df, target_year=None):
-    """计算年度和季节统计"""
+def reduce_months(values, var):
+    """沿月份维度汇总 (n_counties, n_months) 数组；全部缺失的县返回NaN"""
+    if var in SUM_VARS:
+        reduced = np.nansum(values, axis=1)  # 累计值
+        reduced[np.isnan(values).all(axis=1)] = np.nan
+        return reduced
+    return np.nanmean(values, axis=1)  # 平均值
+
+def calculate_annual_seasonal_stats(curr_array, prev_array, geoids, year):
+    """计算年度和季节统计
+
+    curr_array / prev_array 为当年与上一年的 (n_counties, 12, n_vars) 县级月值数组，
+    DJF 由上一年12月与当年1、2月组成（跨年通过索引实现）。
+    """
     print("计算年度和季节统计...")
 
-    # 如果指定了目标年份，只处理该年份的数据
-    if target_year is not None:
-        df = df[df['year'] == target_year].copy()
-        print(f"  只处理 {target_year} 年的数据")
-
-    # DJF跨年处理：将上一年12月计入下一年的DJF
-    # 思路：对每个GEOID，复制一份12月数据并把year加1，再合并后做分组
-    df_adj = df.copy()
-    is_dec = df_adj['month'] == 12
-    if is_dec.any():
-        print("  处理DJF跨年数据...")
-        dec_rows = df_adj[is_dec].copy()
-        dec_rows.loc[:, 'year'] = dec_rows['year'] + 1
-        df_adj = pd.concat([df_adj, dec_rows], ignore_index=True)
-        print(f"  已复制 {len(dec_rows)} 条12月数据到下一年")
-
-    # 获取所有唯一的GEOID和year组合
-    unique_combinations = df_adj[['GEOID', 'year']].drop_duplicates()
-    total_combinations = len(unique_combinations)
-    print(f"  开始计算 {total_combinations} 个县-年组合的统计量...")
-
-    annual_stats = []
-    processed_count = 0
-
-    for (geoid, year), group in df_adj.groupby(['GEOID', 'year']):
-        processed_count += 1
-        if processed_count % 50 == 0:
-            print(f"    [{processed_count:4d}/{total_combinations}] 处理 {geoid}-{year}")
-
-        stats = {'GEOID': geoid, 'year': year}
-
-        # 年度统计
-        for var in ['tas', 'wind', 'prcp', 'rh', 'swrad', 'lwrad', 'psurf', 'cape', 'potevap']:
-            monthly_cols = [col for col in group.columns if col.startswith(f'{var}_')]
-            if monthly_cols:
-                values = group[monthly_cols].values.flatten()
-                values = values[~np.isnan(values)]
-
-                if len(values) > 0:
-                    if var in ['prcp', 'potevap']:
-                        stats[f'{var}_sum_annual'] = np.sum(values)  # 累计值
-                    else:
-                        stats[f'{var}_mean_annual'] = np.mean(values)  # 平均值
-
-        # 季节统计
-        seasons = {
-            'DJF': [12, 1, 2],  # 已在上方通过复制12月至下一年实现跨年
-            'MAM': [3, 4, 5],
-            'JJA': [6, 7, 8],
-            'SON': [9, 10, 11]
-        }
-
-        for season, months in seasons.items():
-            for var in ['tas', 'wind', 'prcp', 'rh', 'swrad', 'lwrad', 'psurf', 'cape', 'potevap']:
-                monthly_cols = [col for col in group.columns if col.startswith(f'{var}_')]
-                season_cols = [col for col in monthly_cols if any(f'{m:02d}' in col for m in months)]
-
-                if season_cols:
-                    values = group[season_cols].values.flatten()
-                    values = values[~np.isnan(values)]
-
-                    if len(values) > 0:
-                        if var in ['prcp', 'potevap']:
-                            stats[f'{var}_sum_{season}'] = np.sum(values)  # 累计值
-                        else:
-                            stats[f'{var}_mean_{season}'] = np.mean(values)  # 平均值
-
-        annual_stats.append(stats)
-
-    print(f"  统计计算完成，共处理 {processed_count} 个县-年组合")
-
-    out = pd.DataFrame(annual_stats)
-
-    # 如果指定了目标年份，只返回该年份的数据
-    if target_year is not None:
-        out = out[out['year'] == target_year]
-        print(f"  只输出 {target_year} 年的数据，共 {len(out)} 条记录")
-    else:
-        # 否则确保只输出起始年到结束年范围
-        out = out[(out['year'] >= START_YEAR) & (out['year'] <= END_YEAR)]
-        print(f"  最终输出 {len(out)} 条记录")
+    stats = {'GEOID': geoids, 'year': np.full(len(geoids), year)}
+
+    # 年度统计
+    for var_idx, var in enumerate(MET_VARS):
+        stat = 'sum' if var in SUM_VARS else 'mean'
+        stats[f'{var}_{stat}_annual'] = reduce_months(curr_array[:, :, var_idx], var)
+
+    # 季节统计
+    for season, months in SEASONS.items():
+        month_slices = [
+            prev_array[:, 11, :] if (season == 'DJF' and month == 12) else curr_array[:, month - 1, :]
+            for month in months
+        ]
+        season_block = np.stack(month_slices, axis=1)
+        for var_idx, var in enumerate(MET_VARS):
+            stat = 'sum' if var in SUM_VARS else 'mean'
+            stats[f'{var}_{stat}_{season}'] = reduce_months(season_block[:, :, var_idx], var)
+
+    # 与逐组计算一致：完全没有数据的变量不输出
+    out = pd.DataFrame(stats).dropna(axis=1, how='all')
+    print(f"  统计计算完成，共 {len(out)} 个县-年组合")
 
     return out
 
@@ -464,7 +456,7 @@ def main():
 
     # Load paths from config
     nldas_folder, county_shape_file, output_folder = load_paths()
-    output_file = f"NLDAS_{START_YEAR}_{END_YEAR}.csv"
+    output_file = f"NLDAS_{START_YEAR}_{END_YEAR}"
 
     # 1. Get NLDAS file list
     print("Step 1: Get NLDAS file list")
@@ -502,8 +494,7 @@ def main():
         # Rename GEOID to COUNTY_FIPS for consistency with other datasets
         annual_df = annual_df.rename(columns={"GEOID": "COUNTY_FIPS"})
 
-        output_path = output_folder / output_file
-        annual_df.to_csv(output_path, index=False, encoding='utf-8')
+        output_path = save_table(annual_df, output_folder / output_file)
         print(f"  Combined data saved to: {output_path}")
 
     if not annual_df.empty:
@@ -526,8 +517,8 @@ def main():
 
         # 显示年度文件列表
         print("\n生成的年度文件:")
-        import glob
-        year_files = glob.glob(os.path.join(output_folder, "NLDAS_*.csv"))
+        output_suffix = 'csv' if OUTPUT_FORMAT == 'csv' else 'parquet'
+        year_files = glob.glob(os.path.join(output_folder, f"NLDAS_*.{output_suffix}"))
         for year_file in sorted(year_files):
             file_size = os.path.getsize(year_file) / (1024 * 1024)  # MB
             print(f"  {os.path.basename(year_file)} ({file_size:.1f} MB)")
@@ -26,6 +26,18 @@ def load_config(config_path):
     with open(config_path, 'r') as f:
         return yaml.safe_load(f)
 
+def read_table(csv_path):
+    """Reads a processed table, preferring a Parquet sibling of the CSV path when it is at least as new.
+
+    A Parquet older than the CSV (the CSV was regenerated or edited by hand) is ignored.
+    """
+    csv_path = Path(csv_path)
+    parquet_path = csv_path.with_suffix('.parquet')
+    if parquet_path.exists() and (not csv_path.exists()
+                                  or parquet_path.stat().st_mtime >= csv_path.stat().st_mtime):
+        return pd.read_parquet(parquet_path)
+    return pd.read_csv(csv_path)
+
 def calculate_density(config):
     """
     Loads pesticide and land use data, calculates pesticide density,
@@ -51,8 +63,8 @@ def calculate_density(config):
 
     # Load datasets
     try:
-        pesticide_df = pd.read_csv(pesticide_path)
-        land_use_df = pd.read_csv(land_use_path)
+        pesticide_df = read_table(pesticide_path)
+        land_use_df = read_table(land_use_path)
     except FileNotFoundError as e:
         print(f"Error loading data: {e}")
         return
@@ -64,9 +76,9 @@ def calculate_density(config):
     if 'YEAR' in land_use_df.columns and 'Year' not in land_use_df.columns:
         land_use_df.rename(columns={'YEAR': 'Year'}, inplace=True)
 
-    # Ensure key columns are of the same type
-    pesticide_df['COUNTY_FIPS'] = pesticide_df['COUNTY_FIPS'].astype(str).str.zfill(5)
-    land_use_df['COUNTY_FIPS'] = land_use_df['COUNTY_FIPS'].astype(str).str.zfill(5)
+    # Ensure key columns are of the same type; merge on integer FIPS (faster to hash than strings)
+    pesticide_df['COUNTY_FIPS'] = pd.to_numeric(pesticide_df['COUNTY_FIPS']).astype(np.int32)
+    land_use_df['COUNTY_FIPS'] = pd.to_numeric(land_use_df['COUNTY_FIPS']).astype(np.int32)
     
     # Select only necessary columns from land use data
     ag_area_df = land_use_df[['COUNTY_FIPS', 'Year', 'nlcd_agriculture_km2']]
@@ -81,19 +93,25 @@ def calculate_density(config):
     
     # Handle cases where agricultural area is zero or missing to avoid division by zero
     # Replace area <= 0 with NaN, so that division results in NaN
-    merged_df['nlcd_agriculture_km2_safe'] = merged_df['nlcd_agriculture_km2'].replace(0, np.nan)
+    area = merged_df['nlcd_agriculture_km2'].to_numpy(dtype=np.float64, copy=True)
+    area[area <= 0] = np.nan
 
     print(f"Calculating density for {len(pesticide_cols)} pesticide variables...")
-    # Calculate density
-    for col in pesticide_cols:
-        merged_df[col] = merged_df[col] / merged_df['nlcd_agriculture_km2_safe']
+    # Calculate density for all pesticide columns in a single broadcast division
+    values = merged_df[pesticide_cols].to_numpy(dtype=np.float64, copy=True)
+    values /= area[:, None]
 
     # --- Finalize and Save ---
-    # Create the final density dataframe
-    density_df = merged_df[['COUNTY_FIPS', 'Year'] + pesticide_cols]
-    
     # Fill any resulting NaN/inf values with 0, assuming no density if area is 0 or no application
-    density_df.fillna(0, inplace=True)
+    np.nan_to_num(values, copy=False, nan=0.0, posinf=0.0, neginf=0.0)
+
+    # Create the final density dataframe
+    density_df = pd.DataFrame(values, columns=pesticide_cols)
+    density_df.insert(0, 'Year', merged_df['Year'].to_numpy())
+    density_df.insert(0, 'COUNTY_FIPS', merged_df['COUNTY_FIPS'].to_numpy())
+
+    # Format FIPS back to 5-digit strings only for output
+    density_df['COUNTY_FIPS'] = density_df['COUNTY_FIPS'].map('{:05d}'.format)
     
     # Create output directory if it doesn't exist
     output_dir.mkdir(parents=True, exist_ok=True)
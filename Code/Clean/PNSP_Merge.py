@@ -6,9 +6,13 @@ PNSP 农药数据合并与重塑脚本
 - 使用mapping.csv进行化合物映射和分类
 - 输出格式：COUNTY_FIPS | Year | cat1_min/avg/max | ... | chem1_min/avg/max | ...
 - 路径从config.yaml读取：data_sources.usgs_pnsp.original/processed
+- 可选：设置 WDP_ENGINE=polars 使用Polars完成汇总与重塑（需安装polars）
 """
 
+import os
 import sys
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 from pathlib import Path
 import pandas as pd
 import numpy as np
@@ -19,6 +23,52 @@ except Exception as e:
     print("ERROR: 需要PyYAML。请安装: pip install pyyaml", file=sys.stderr)
     sys.exit(1)
 
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pv
+    import pyarrow.parquet as pq
+    from _csv_output import write_csv
+except Exception as e:
+    print("ERROR: 需要PyArrow。请安装: pip install pyarrow", file=sys.stderr)
+    sys.exit(1)
+
+# 可选：joblib 将映射表解析结果缓存到磁盘（按文件修改时间失效）
+try:
+    import joblib  # type: ignore
+except Exception:
+    joblib = None
+
+# 可选：设置环境变量 WDP_ENGINE=polars 时用 Polars 完成汇总与重塑
+try:
+    import polars as pl  # type: ignore
+except Exception:
+    pl = None
+
+# EPest文件中需要的列及其解析类型
+REQUIRED_COLS = ['COMPOUND', 'YEAR', 'STATE_FIPS_CODE', 'COUNTY_FIPS_CODE', 'EPEST_LOW_KG', 'EPEST_HIGH_KG']
+EPEST_COLUMN_TYPES = {
+    'COMPOUND': pa.string(),
+    'YEAR': pa.int32(),
+    'STATE_FIPS_CODE': pa.int32(),
+    'COUNTY_FIPS_CODE': pa.int32(),
+    'EPEST_LOW_KG': pa.float64(),
+    'EPEST_HIGH_KG': pa.float64(),
+}
+
+# 数值列按字符串读取后的合法格式：整数列允许 "12.0" 这类写法，浮点列允许小数与科学计数法
+INT_PATTERN = r'^[+-]?\d+(\.0*)?$'
+FLOAT_PATTERN = r'^[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?$'
+
+def _coerce_numeric(column, type_):
+    """把字符串列转为数值类型，无法解析的值置为空（与 pd.to_numeric(errors='coerce') 一致）"""
+    column = pc.utf8_trim_whitespace(column)
+    pattern = INT_PATTERN if pa.types.is_integer(type_) else FLOAT_PATTERN
+    valid = pc.match_substring_regex(column, pattern)
+    values = pc.cast(pc.if_else(valid, column, pa.scalar(None, pa.string())), pa.float64())
+    return pc.cast(values, type_)
+
+@lru_cache(maxsize=1)
 def load_paths():
     """从config.yaml加载路径"""
     project_root = Path(__file__).resolve().parents[2]
@@ -48,6 +98,10 @@ def load_paths():
     output_dir.mkdir(parents=True, exist_ok=True)
     return input_dir, output_dir
 
+def _read_mapping(path_str, mtime):
+    """读取映射表；mtime 仅作为磁盘缓存键"""
+    return pd.read_csv(path_str)
+
 def load_mapping():
     """加载化合物映射表"""
     project_root = Path(__file__).resolve().parents[2]
@@ -57,15 +111,89 @@ def load_mapping():
         print(f"ERROR: 映射文件不存在: {mapping_path}", file=sys.stderr)
         sys.exit(1)
     
-    mapping = pd.read_csv(mapping_path)
+    if joblib is not None:
+        memory = joblib.Memory(project_root / ".cache" / "pnsp", verbose=0)
+        mapping = memory.cache(_read_mapping)(str(mapping_path), mapping_path.stat().st_mtime)
+    else:
+        mapping = _read_mapping(str(mapping_path), None)
     print(f"加载映射表: {len(mapping)}个化合物，{mapping['category1_id'].nunique()}个类别")
     return mapping
 
+def _process_pnsp_file(file_path, fallback_year):
+    """读取单个EPest文件并标准化，缺少必需列时返回None
+
+    先读取文件开头判断分隔符（制表符或逗号），再用PyArrow多线程CSV读取器解析，
+    解析时只读取必需列并直接确定数值类型。
+    """
+    with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
+        sample = f.read(4096)
+    header = sample.splitlines()[0] if sample else ''
+    sep = '\t' if header.count('\t') > header.count(',') else ','
+
+    # 标准化列名
+    column_names = [col.strip().strip('"') for col in header.split(sep)]
+
+    # 检查必需列
+    missing_cols = [col for col in REQUIRED_COLS if col not in column_names]
+    if missing_cols:
+        print(f"  ❌ 缺少必需列: {missing_cols}")
+        return None
+
+    read_options = pv.ReadOptions(column_names=column_names, skip_rows=1)
+    parse_options = pv.ParseOptions(delimiter=sep)
+    try:
+        table = pv.read_csv(
+            file_path,
+            read_options=read_options,
+            parse_options=parse_options,
+            convert_options=pv.ConvertOptions(include_columns=REQUIRED_COLS, column_types=EPEST_COLUMN_TYPES),
+        )
+    except pa.ArrowInvalid:
+        # 个别单元格不是合法数值时，按字符串重新读取再逐列转换，只把这些单元格置为空而不是放弃整个文件
+        table = pv.read_csv(
+            file_path,
+            read_options=read_options,
+            parse_options=parse_options,
+            convert_options=pv.ConvertOptions(include_columns=REQUIRED_COLS,
+                                              column_types={col: pa.string() for col in REQUIRED_COLS}),
+        )
+        for col, type_ in EPEST_COLUMN_TYPES.items():
+            if not pa.types.is_string(type_):
+                table = table.set_column(table.schema.get_field_index(col), col, _coerce_numeric(table[col], type_))
+    df = table.to_pandas(types_mapper=pd.ArrowDtype)
+
+    # 标准化FIPS代码（整数形式 州*1000+县，输出时再格式化为5位字符串）
+    df['COUNTY_FIPS_INT'] = df['STATE_FIPS_CODE'] * 1000 + df['COUNTY_FIPS_CODE']
+
+    # 缺失值处理（数值类型已在解析时确定）
+    df['EPEST_LOW_KG'] = df['EPEST_LOW_KG'].fillna(0)
+    df['EPEST_HIGH_KG'] = df['EPEST_HIGH_KG'].fillna(0)
+    df['YEAR'] = df['YEAR'].fillna(fallback_year).astype(int)
+
+    # 过滤有效数据
+    df = df[(df['EPEST_LOW_KG'] >= 0) & (df['EPEST_HIGH_KG'] >= 0) & df['COUNTY_FIPS_INT'].notna()]
+    return df
+
+def _load_pnsp_candidates(file_paths, fallback_year):
+    """依次尝试候选文件，返回第一个成功处理的DataFrame，均失败时返回None（在子进程中执行）"""
+    for file_path in file_paths:
+        print(f"处理文件: {file_path.name}")
+        try:
+            df = _process_pnsp_file(file_path, fallback_year)
+        except Exception as e:
+            print(f"  ❌ 错误: {e}")
+            continue
+        if df is not None:
+            print(f"  ✅ 成功处理，{len(df)}行")
+            return df
+    return None
+
 def merge_pnsp_data(input_dir):
-    """合并所有PNSP数据文件"""
+    """合并所有PNSP数据文件（各文件在多进程中并行读取）"""
     print("开始合并PNSP数据...")
     
-    all_data = []
+    # (候选文件列表, 缺失年份时的默认年份, 未成功时的提示)
+    tasks = []
     
     # 处理单独年份文件 (1999-2012, 2018-2019)
     single_years = list(range(1999, 2013)) + list(range(2018, 2020))
@@ -76,87 +204,25 @@ def merge_pnsp_data(input_dir):
             f"EPest.county.estimates.{year}.txt",
             f"EPest_county_estimates_{year}.txt"
         ]
-        
-        file_found = False
-        for filename in possible_files:
-            file_path = input_dir / filename
-            if file_path.exists():
-                print(f"处理文件: {filename}")
-                try:
-                    # 读取数据，自动检测分隔符
-                    df = pd.read_csv(file_path, sep=None, engine='python', encoding='utf-8')
-                    
-                    # 标准化列名
-                    df.columns = [col.strip() for col in df.columns]
-                    
-                    # 检查必需列
-                    required_cols = ['COMPOUND', 'YEAR', 'STATE_FIPS_CODE', 'COUNTY_FIPS_CODE', 'EPEST_LOW_KG', 'EPEST_HIGH_KG']
-                    if not all(col in df.columns for col in required_cols):
-                        print(f"  ❌ 缺少必需列: {[col for col in required_cols if col not in df.columns]}")
-                        continue
-                    
-                    # 只保留需要的列
-                    df = df[required_cols].copy()
-                    
-                    # 标准化FIPS代码
-                    df['COUNTY_FIPS'] = (df['STATE_FIPS_CODE'].astype(str).str.zfill(2) + 
-                                        df['COUNTY_FIPS_CODE'].astype(str).str.zfill(3))
-                    
-                    # 确保数值列
-                    df['EPEST_LOW_KG'] = pd.to_numeric(df['EPEST_LOW_KG'], errors='coerce').fillna(0)
-                    df['EPEST_HIGH_KG'] = pd.to_numeric(df['EPEST_HIGH_KG'], errors='coerce').fillna(0)
-                    df['YEAR'] = pd.to_numeric(df['YEAR'], errors='coerce').fillna(year).astype(int)
-                    
-                    # 过滤有效数据
-                    df = df[(df['EPEST_LOW_KG'] >= 0) & (df['EPEST_HIGH_KG'] >= 0)]
-                    
-                    all_data.append(df)
-                    print(f"  ✅ 成功处理，{len(df)}行")
-                    file_found = True
-                    break
-                    
-                except Exception as e:
-                    print(f"  ❌ 错误: {e}")
-                    continue
-        
-        if not file_found:
-            print(f"⚠️  未找到{year}年的数据文件")
+        existing_files = [input_dir / filename for filename in possible_files if (input_dir / filename).exists()]
+        tasks.append((existing_files, year, f"⚠️  未找到{year}年的数据文件"))
     
     # 处理2013-2017合并文件
     combined_file = input_dir / "EPest_county_estimates_2013_2017_v2.txt"
     if combined_file.exists():
-        print(f"处理合并文件: {combined_file.name}")
-        try:
-            # 读取数据，自动检测分隔符
-            df = pd.read_csv(combined_file, sep=None, engine='python', encoding='utf-8')
-            
-            # 标准化列名
-            df.columns = [col.strip() for col in df.columns]
-            
-            # 检查必需列
-            required_cols = ['COMPOUND', 'YEAR', 'STATE_FIPS_CODE', 'COUNTY_FIPS_CODE', 'EPEST_LOW_KG', 'EPEST_HIGH_KG']
-            if not all(col in df.columns for col in required_cols):
-                print(f"  ❌ 缺少必需列: {[col for col in required_cols if col not in df.columns]}")
-            else:
-                # 只保留需要的列
-                df = df[required_cols].copy()
-                
-                # 标准化FIPS代码
-                df['COUNTY_FIPS'] = (df['STATE_FIPS_CODE'].astype(str).str.zfill(2) + 
-                                    df['COUNTY_FIPS_CODE'].astype(str).str.zfill(3))
-                
-                # 确保数值列
-                df['EPEST_LOW_KG'] = pd.to_numeric(df['EPEST_LOW_KG'], errors='coerce').fillna(0)
-                df['EPEST_HIGH_KG'] = pd.to_numeric(df['EPEST_HIGH_KG'], errors='coerce').fillna(0)
-                df['YEAR'] = pd.to_numeric(df['YEAR'], errors='coerce').fillna(2013).astype(int)
-                
-                # 过滤有效数据
-                df = df[(df['EPEST_LOW_KG'] >= 0) & (df['EPEST_HIGH_KG'] >= 0)]
-                
+        tasks.append(([combined_file], 2013, None))
+    
+    all_data = []
+    max_workers = min(len(tasks), os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(_load_pnsp_candidates, file_paths, fallback_year)
+                   for file_paths, fallback_year, _ in tasks]
+        for (_, _, missing_message), future in zip(tasks, futures):
+            df = future.result()
+            if df is not None:
                 all_data.append(df)
-                print(f"  ✅ 成功处理，{len(df)}行")
-        except Exception as e:
-            print(f"  ❌ 错误: {e}")
+            elif missing_message:
+                print(missing_message)
     
     if not all_data:
         print("ERROR: 没有成功处理任何文件")
@@ -169,13 +235,51 @@ def merge_pnsp_data(input_dir):
     
     return merged_df
 
+def sum_by_codes(row_codes, col_codes, n_rows, n_cols, weights):
+    """按 (行编码, 列编码) 对权重求和，返回 (n_rows, n_cols) 数组，未出现的组合为0"""
+    flat = np.bincount(row_codes * n_cols + col_codes, weights=weights, minlength=n_rows * n_cols)
+    return flat.reshape(n_rows, n_cols)
+
+def _wide_polars(lf, key, prefix):
+    """Polars：按 (县, 年, key) 汇总并展开为 avg/max/min 宽表"""
+    agg = (
+        lf.group_by(['COUNTY_FIPS_INT', 'YEAR', key])
+        .agg(pl.col('EPEST_LOW_KG').sum().alias('min'), pl.col('EPEST_HIGH_KG').sum().alias('max'))
+        .with_columns(((pl.col('min') + pl.col('max')) * 0.5).alias('avg'))
+        .collect()
+    )
+    ids = sorted(agg[key].unique().to_list())
+    wide = agg.pivot(on=key, index=['COUNTY_FIPS_INT', 'YEAR'], values=['avg', 'max', 'min'])
+    columns = [f"{suffix}_{entity_id}" for suffix in ['avg', 'max', 'min'] for entity_id in ids]
+    return wide.select(
+        'COUNTY_FIPS_INT', 'YEAR',
+        *[pl.col(col).alias(f"{prefix}{col.split('_')[1]}_{col.split('_')[0]}") for col in columns],
+    )
+
+def reshape_data_polars(merged_df):
+    """Polars 引擎：与 numpy 路径输出相同的列顺序与行顺序"""
+    lf = pl.from_pandas(merged_df[['COUNTY_FIPS_INT', 'YEAR', 'category1_id', 'compound_id',
+                                   'EPEST_LOW_KG', 'EPEST_HIGH_KG']]).lazy()
+    final = (
+        _wide_polars(lf, 'category1_id', 'cat')
+        .join(_wide_polars(lf, 'compound_id', 'chem'), on=['COUNTY_FIPS_INT', 'YEAR'], how='full', coalesce=True)
+        .sort(['COUNTY_FIPS_INT', 'YEAR'])
+    )
+    value_cols = [col for col in final.columns if col not in ('COUNTY_FIPS_INT', 'YEAR')]
+    final = final.with_columns(pl.col(value_cols).fill_null(0.0).round(1))
+    return final.to_pandas()
+
 def reshape_data(merged_df, mapping):
     """重塑数据为宽格式"""
     print("开始重塑数据...")
     
-    # 合并映射表
-    merged_df = merged_df.merge(mapping[['compound_name', 'compound_id', 'category1_id']], 
-                                left_on='COMPOUND', right_on='compound_name', how='left')
+    # 映射化合物ID和类别ID（字典查找，避免构建合并哈希表）
+    compound_map = dict(zip(mapping['compound_name'].values, mapping['compound_id'].values))
+    category_map = dict(zip(mapping['compound_name'].values, mapping['category1_id'].values))
+    merged_df = merged_df.assign(
+        compound_id=merged_df['COMPOUND'].map(compound_map).astype('Int32'),
+        category1_id=merged_df['COMPOUND'].map(category_map).astype('Int32'),
+    )
     
     # 检查未匹配的化合物
     unmatched = merged_df[merged_df['compound_id'].isna()]['COMPOUND'].unique()
@@ -189,9 +293,6 @@ def reshape_data(merged_df, mapping):
     matched_rows = len(merged_df)
     print(f"原始数据: {original_rows}行，匹配后: {matched_rows}行")
     
-    merged_df['compound_id'] = merged_df['compound_id'].astype(int)
-    merged_df['category1_id'] = merged_df['category1_id'].astype(int)
-    
     # 检查匹配后的化合物和类别数量
     unique_compounds = merged_df['compound_id'].nunique()
     unique_categories = merged_df['category1_id'].nunique()
@@ -199,91 +300,65 @@ def reshape_data(merged_df, mapping):
     
     print(f"有效数据: {len(merged_df)}行")
     
-    # 按类别聚合（将同一类别下所有化合物的用量相加）
-    print("计算类别级别汇总（同一类别下所有化合物用量相加）...")
-    category_agg = merged_df.groupby(['COUNTY_FIPS', 'YEAR', 'category1_id']).agg({
-        'EPEST_LOW_KG': 'sum',
-        'EPEST_HIGH_KG': 'sum'
-    }).reset_index()
-    
-    # 计算平均值
-    category_agg['EPEST_AVG_KG'] = (category_agg['EPEST_LOW_KG'] + category_agg['EPEST_HIGH_KG']) / 2
-    
-    # 重塑类别数据为宽格式
-    category_wide = category_agg.pivot_table(
-        index=['COUNTY_FIPS', 'YEAR'],
-        columns='category1_id',
-        values=['EPEST_LOW_KG', 'EPEST_AVG_KG', 'EPEST_HIGH_KG'],
-        fill_value=0
-    ).reset_index()
-    
-    # 重命名列 - 修正列名格式
-    new_cols = []
-    for col in category_wide.columns:
-        if col[1] != '':  # 多层索引的数据列
-            if 'LOW' in col[0]:
-                suffix = 'min'
-            elif 'HIGH' in col[0]:
-                suffix = 'max'
-            elif 'AVG' in col[0]:
-                suffix = 'avg'
-            else:
-                suffix = col[0].split('_')[1].lower()
-            new_cols.append(f"cat{col[1]}_{suffix}")
-        else:  # 单层索引的标识列
-            new_cols.append(col[0])
-    category_wide.columns = new_cols
-    
-    # 按化合物聚合
-    print("计算化合物级别数据...")
-    compound_agg = merged_df.groupby(['COUNTY_FIPS', 'YEAR', 'compound_id']).agg({
-        'EPEST_LOW_KG': 'sum',
-        'EPEST_HIGH_KG': 'sum'
-    }).reset_index()
-    
-    # 计算平均值
-    compound_agg['EPEST_AVG_KG'] = (compound_agg['EPEST_LOW_KG'] + compound_agg['EPEST_HIGH_KG']) / 2
-    
-    # 重塑化合物数据为宽格式
-    compound_wide = compound_agg.pivot_table(
-        index=['COUNTY_FIPS', 'YEAR'],
-        columns='compound_id',
-        values=['EPEST_LOW_KG', 'EPEST_AVG_KG', 'EPEST_HIGH_KG'],
-        fill_value=0
-    ).reset_index()
-    
-    # 重命名列 - 修正列名格式
-    new_cols = []
-    for col in compound_wide.columns:
-        if col[1] != '':  # 多层索引的数据列
-            if 'LOW' in col[0]:
-                suffix = 'min'
-            elif 'HIGH' in col[0]:
-                suffix = 'max'
-            elif 'AVG' in col[0]:
-                suffix = 'avg'
-            else:
-                suffix = col[0].split('_')[1].lower()
-            new_cols.append(f"chem{col[1]}_{suffix}")
-        else:  # 单层索引的标识列
-            new_cols.append(col[0])
-    compound_wide.columns = new_cols
-    
-    # 合并类别和化合物数据
-    print("合并类别和化合物数据...")
-    final_df = category_wide.merge(compound_wide, on=['COUNTY_FIPS', 'YEAR'], how='outer')
-    
-    # 填充缺失值并保留一位小数
-    final_df = final_df.fillna(0)
-    
-    # 对所有数值列保留一位小数
-    numeric_cols = [col for col in final_df.columns if col not in ['COUNTY_FIPS', 'YEAR']]
-    for col in numeric_cols:
-        final_df[col] = final_df[col].round(1)
+    # 键列压缩为最小整数类型，减少编码时的哈希与内存带宽
+    merged_df = merged_df.astype({
+        'COUNTY_FIPS_INT': 'int32',
+        'YEAR': 'int16',
+        'compound_id': 'int32',
+        'category1_id': 'int16',
+    })
+    
+    if os.environ.get('WDP_ENGINE') == 'polars':
+        if pl is None:
+            print("WARNING: WDP_ENGINE=polars 但未安装polars，改用默认引擎", file=sys.stderr)
+        else:
+            print("计算类别级别和化合物级别汇总（Polars）...")
+            final_df = reshape_data_polars(merged_df)
+            print(f"重塑完成，最终数据: {len(final_df)}行，{len(final_df.columns)}列")
+            return final_df
+    
+    # 对 (COUNTY_FIPS, YEAR) 行键以及类别、化合物分别编码
+    row_codes, row_keys = pd.MultiIndex.from_arrays([merged_df['COUNTY_FIPS_INT'], merged_df['YEAR']]).factorize(sort=True)
+    cat_codes, cat_ids = pd.factorize(merged_df['category1_id'], sort=True)
+    cmp_codes, cmp_ids = pd.factorize(merged_df['compound_id'], sort=True)
+    n_rows = len(row_keys)
+    
+    low_vals = merged_df['EPEST_LOW_KG'].to_numpy(dtype=np.float64)
+    high_vals = merged_df['EPEST_HIGH_KG'].to_numpy(dtype=np.float64)
+    
+    # 一次扫描同时完成类别级（同一类别下所有化合物用量相加）和化合物级汇总
+    # 各统计块直接写入预分配的宽表数组（仅覆盖观测到的行键，不做笛卡尔展开）
+    print("计算类别级别和化合物级别汇总...")
+    values = np.empty((n_rows, 3 * (len(cat_ids) + len(cmp_ids))), dtype=np.float64)
+    column_names = []
+    offset = 0
+    for codes, ids, prefix in [(cat_codes, cat_ids, 'cat'), (cmp_codes, cmp_ids, 'chem')]:
+        low = sum_by_codes(row_codes, codes, n_rows, len(ids), low_vals)
+        high = sum_by_codes(row_codes, codes, n_rows, len(ids), high_vals)
+        width = len(ids)
+        np.add(low, high, out=values[:, offset:offset + width])
+        values[:, offset:offset + width] *= 0.5
+        values[:, offset + width:offset + 2 * width] = high
+        values[:, offset + 2 * width:offset + 3 * width] = low
+        offset += 3 * width
+        for suffix in ['avg', 'max', 'min']:
+            column_names.extend(f"{prefix}{entity_id}_{suffix}" for entity_id in ids)
+    
+    # 组装宽表（类别与化合物共享同一行键，无需再合并），整体保留一位小数
+    np.round(values, 1, out=values)
+    final_df = pd.DataFrame(values, columns=column_names)
+    final_df.insert(0, 'YEAR', row_keys.get_level_values(1).to_numpy())
+    final_df.insert(0, 'COUNTY_FIPS_INT', row_keys.get_level_values(0).to_numpy(dtype=np.int32))
     
     print(f"重塑完成，最终数据: {len(final_df)}行，{len(final_df.columns)}列")
     return final_df
 
+def write_output(final_df, output_file):
+    """用PyArrow写出CSV，并写出同名Parquet（zstd）供下游快速读取"""
+    table = pa.Table.from_pandas(final_df, preserve_index=False)
+    write_csv(table, output_file)
+    pq.write_table(table, str(output_file.with_suffix('.parquet')), compression='zstd')
+
 def main():
     """主函数"""
     print("=== PNSP数据合并与重塑脚本 ===\n")
@@ -298,9 +373,12 @@ def main():
     # 重塑数据
     final_df = reshape_data(merged_df, mapping)
     
+    # 整数FIPS仅在输出时格式化为5位字符串
+    final_df.insert(0, 'COUNTY_FIPS', final_df.pop('COUNTY_FIPS_INT').map('{:05d}'.format))
+    
     # 保存结果
     output_file = output_dir / "PNSP.csv"
-    final_df.to_csv(output_file, index=False)
+    write_output(final_df, output_file)
     print(f"\n数据已保存到: {output_file}")
     
     # 输出统计信息
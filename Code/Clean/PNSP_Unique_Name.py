@@ -18,7 +18,17 @@ except Exception as e:
     print("ERROR: PyYAML is required. pip install pyyaml", file=sys.stderr)
     sys.exit(1)
 
-import pandas as pd
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pv
+    import pyarrow.dataset as pads
+except Exception as e:
+    print("ERROR: PyArrow is required. pip install pyarrow", file=sys.stderr)
+    sys.exit(1)
+
+# Candidate column names often seen in PNSP datasets
+COMPOUND_COLUMNS = ["Compound", "compound", "COMPOUND", "Compound_Name", "compound_name"]
 
 
 def load_paths() -> tuple[Path, Path]:
@@ -44,40 +54,54 @@ def load_paths() -> tuple[Path, Path]:
     return input_dir, output_dir
 
 
+def probe_header(file_path: Path) -> tuple[str, tuple[str, ...], str] | None:
+    """Return (delimiter, column names, compound column) from a file's header line."""
+    with file_path.open("rb") as f:
+        header = f.readline().decode("latin-1").rstrip("\r\n")
+    delimiter = max(["\t", ",", "|"], key=header.count)
+    columns = tuple(col.strip().strip('"') for col in header.split(delimiter))
+    for col in COMPOUND_COLUMNS:
+        if col in columns:
+            return delimiter, columns, col
+    return None
+
+
+def decode_name(raw: bytes) -> str:
+    try:
+        return raw.decode("utf-8")
+    except UnicodeDecodeError:
+        return raw.decode("latin-1")
+
+
 def collect_unique_compounds(input_dir: Path) -> list[str]:
-    unique = set()
-    encodings = ["utf-8", "latin1", "iso-8859-1", "cp1252", "windows-1252"]
     files = list(sorted(input_dir.glob("*.txt"))) + list(sorted(input_dir.glob("*.csv")))
+
+    # Files sharing a header layout are scanned together as one multithreaded dataset
+    groups: dict[tuple[str, tuple[str, ...], str], list[str]] = {}
     for file_path in files:
-        df = None
-        # Try multiple encodings and delimiter inference first
-        for enc in encodings:
-            try:
-                df = pd.read_csv(file_path, encoding=enc, sep=None, engine="python")
-                break
-            except UnicodeDecodeError:
-                df = None
-                continue
-            except Exception:
-                df = None
-                continue
-        # Fallback to common delimiters if needed
-        if df is None:
-            for sep in ["\t", ",", "|"]:
-                try:
-                    df = pd.read_csv(file_path, encoding="utf-8", sep=sep)
-                    break
-                except Exception:
-                    df = None
-                    continue
-        if df is None:
+        probe = probe_header(file_path)
+        if probe is not None:
+            groups.setdefault(probe, []).append(str(file_path))
+
+    unique = set()
+    for (delimiter, columns, compound_col), paths in groups.items():
+        # Read names as raw bytes so mixed file encodings need no per-file retries
+        file_format = pads.CsvFileFormat(
+            parse_options=pv.ParseOptions(delimiter=delimiter),
+            read_options=pv.ReadOptions(column_names=list(columns), skip_rows=1),
+            convert_options=pv.ConvertOptions(column_types={compound_col: pa.binary()}),
+        )
+        try:
+            table = pads.dataset(paths, format=file_format).to_table(columns=[compound_col])
+        except pa.ArrowInvalid as e:
+            print(f"WARNING: skipping {len(paths)} file(s) that could not be parsed: {e}", file=sys.stderr)
             continue
-        # Candidate column names often seen in PNSP datasets
-        for col in ["Compound", "compound", "COMPOUND", "Compound_Name", "compound_name"]:
-            if col in df.columns:
-                values = df[col].dropna().astype(str).str.strip()
-                unique.update(v for v in values if v)
-                break
+        for raw in pc.unique(table.column(compound_col)).to_pylist():
+            if raw is None:
+                continue
+            name = decode_name(raw).strip()
+            if name:
+                unique.add(name)
     return sorted(unique)
 
 
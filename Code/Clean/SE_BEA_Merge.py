@@ -7,87 +7,95 @@ BEA 经济数据合并脚本
 - 处理CAINC1（个人收入）和CAGDP1（GDP）数据
 """
 
-import sys
-from pathlib import Path
+import csv
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 import pandas as pd
 import numpy as np
 import glob
-import os
-import warnings
-import yaml
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pv
+from _paths import get_paths
+from _csv_output import write_csv
 
-def load_paths():
-    """从config.yaml加载路径"""
-    project_root = Path(__file__).resolve().parents[2]
-    config_path = project_root / "config.yaml"
-    if not config_path.exists():
-        sys.exit(f"ERROR: Configuration file not found: {config_path}")
+# Optional: numba compiles the GDP interpolation kernel (pure Python fallback otherwise)
+try:
+    from numba import njit  # type: ignore
+except Exception:  # pragma: no cover
+    njit = None
 
-    with config_path.open("r", encoding="utf-8") as f:
-        cfg = yaml.safe_load(f)
+def _read_bea(file_path, valid_linecodes, year_range):
+    """Read one BEA state file into an Arrow table of county rows with valid LineCodes"""
+    with open(file_path, 'rb') as f:
+        header = next(csv.reader([f.readline().decode('latin-1').lstrip('\ufeff')]))
+    year_cols = {str(year) for year in year_range}
+    keep = [col for col in header if col.strip() in {'GeoFIPS', 'GeoName', 'LineCode', 'Description'} | year_cols]
+    
+    convert_options = pv.ConvertOptions(
+        include_columns=keep,
+        column_types={col: pa.string() for col in keep},
+    )
+    # Footnote lines at the end of each file have fewer fields and are skipped
+    parse_options = pv.ParseOptions(invalid_row_handler=lambda row: 'skip')
+    for encoding in ['utf-8', 'latin-1']:
+        try:
+            table = pv.read_csv(
+                file_path,
+                read_options=pv.ReadOptions(use_threads=True, encoding=encoding),
+                parse_options=parse_options,
+                convert_options=convert_options,
+            )
+            break
+        except pa.ArrowInvalid:
+            if encoding == 'latin-1':
+                raise
+    table = table.rename_columns([col.strip() for col in table.column_names])
+    
+    geofips = pc.replace_substring_regex(table['GeoFIPS'], r'[\s"]+', '')
+    linecode = pc.utf8_trim_whitespace(table['LineCode'])
+    mask = pc.and_(
+        pc.match_substring_regex(geofips, r'^\d{5}$'),
+        pc.is_in(linecode, value_set=pa.array([str(code) for code in valid_linecodes])),
+    )
+    table = table.set_column(table.schema.get_field_index('GeoFIPS'), 'GeoFIPS', geofips)
+    table = table.set_column(table.schema.get_field_index('LineCode'), 'LineCode', linecode)
+    # Filter before casting: footnote rows and "(NA)" LineCodes would make the int cast fail
+    table = table.filter(pc.fill_null(mask, False))
+    return table.set_column(table.schema.get_field_index('LineCode'), 'LineCode', pc.cast(table['LineCode'], pa.int64()))
 
+def _process_bea_file(file_path, year_range, valid_linecodes):
+    """Load one BEA state file, keeping county rows, valid LineCodes and the requested years"""
     try:
-        bea_config = cfg["data_sources"]["socioeconomic"]["bea"]
-        input_rel = bea_config["original"]
-        output_rel = bea_config["processed"]
-    except (KeyError, TypeError):
-        sys.exit("ERROR: config.yaml is missing the required path for data_sources.socioeconomic.bea")
-
-    input_dir = (project_root / input_rel).resolve()
-    output_dir = (project_root / output_rel).resolve()
-
-    if not input_dir.exists():
-        sys.exit(f"ERROR: Input directory not found: {input_dir}")
+        state = file_path.split('/')[-1].split('_')[1]
+        if len(state) != 2 or state in ['MS', 'MSA', 'PORT', 'CSA', 'MDIV', 'MIC']:
+            return None
+            
+        print(f"  Processing {state}...")
+        
+        table = _read_bea(file_path, valid_linecodes, year_range)
+        if not any(str(year) in table.column_names for year in year_range):
+            print(f"    No year columns found for {state}")
+            return None
+            
+        return table.to_pandas()
+        
+    except Exception as e:
+        print(f"  Error processing {file_path}: {e}")
+        return None
 
-    output_dir.mkdir(parents=True, exist_ok=True)
-    return input_dir, output_dir
+def load_bea_files(file_paths, year_range, valid_linecodes):
+    """Process BEA state files in parallel worker processes, preserving file order"""
+    worker = partial(_process_bea_file, year_range=year_range, valid_linecodes=valid_linecodes)
+    with ProcessPoolExecutor() as executor:
+        return [df for df in executor.map(worker, file_paths) if df is not None]
 
 def load_and_process_cainc1_data(input_dir):
     """Load and process CAINC1 (Personal Income) data"""
     print("Loading CAINC1 (Personal Income) data...")
     
     cainc1_files = glob.glob(str(input_dir / "CAINC1/CAINC1_*_1969_2023.csv"))
-    all_data = []
-    
-    for file_path in cainc1_files:
-        try:
-            state = file_path.split('/')[-1].split('_')[1]
-            if len(state) != 2 or state in ['MS', 'MSA', 'PORT', 'CSA', 'MDIV', 'MIC']:
-                continue
-                
-            print(f"  Processing {state}...")
-            
-            for encoding in ['utf-8', 'latin-1', 'cp1252', 'iso-8859-1']:
-                try:
-                    df = pd.read_csv(file_path, encoding=encoding)
-                    break
-                except UnicodeDecodeError:
-                    continue
-            else:
-                print(f"    Could not read {file_path} with any encoding")
-                continue
-            
-            df['GeoFIPS'] = df['GeoFIPS'].str.strip().str.replace('"', '').str.replace(' ', '')
-            df = df[df['GeoFIPS'].str.len() == 5]
-            
-            if df['LineCode'].dtype == 'object':
-                df['LineCode'] = pd.to_numeric(df['LineCode'], errors='coerce')
-            
-            df = df[df['LineCode'].isin([1, 2, 3])]
-            
-            year_cols = [str(year) for year in range(1999, 2020)]
-            available_years = [col for col in year_cols if col in df.columns]
-            
-            if len(available_years) == 0:
-                print(f"    No year columns found for {state}")
-                continue
-                
-            df = df[['GeoFIPS', 'GeoName', 'LineCode', 'Description'] + available_years]
-            all_data.append(df)
-            
-        except Exception as e:
-            print(f"  Error processing {file_path}: {e}")
-            continue
+    all_data = load_bea_files(cainc1_files, range(1999, 2020), [1, 2, 3])
     
     if not all_data:
         raise ValueError("No CAINC1 data loaded")
@@ -102,47 +110,7 @@ def load_and_process_cagdp1_data(input_dir):
     print("Loading CAGDP1 (GDP) data...")
     
     cagdp1_files = glob.glob(str(input_dir / "CAGDP1/CAGDP1_*_2001_2023.csv"))
-    all_data = []
-    
-    for file_path in cagdp1_files:
-        try:
-            state = file_path.split('/')[-1].split('_')[1]
-            if len(state) != 2 or state in ['MS', 'MSA', 'PORT', 'CSA', 'MDIV', 'MIC']:
-                continue
-                
-            print(f"  Processing {state}...")
-            
-            for encoding in ['utf-8', 'latin-1', 'cp1252', 'iso-8859-1']:
-                try:
-                    df = pd.read_csv(file_path, encoding=encoding)
-                    break
-                except UnicodeDecodeError:
-                    continue
-            else:
-                print(f"    Could not read {file_path} with any encoding")
-                continue
-            
-            df['GeoFIPS'] = df['GeoFIPS'].str.strip().str.replace('"', '').str.replace(' ', '')
-            df = df[df['GeoFIPS'].str.len() == 5]
-            
-            if df['LineCode'].dtype == 'object':
-                df['LineCode'] = pd.to_numeric(df['LineCode'], errors='coerce')
-            
-            df = df[df['LineCode'].isin([1, 2])]
-            
-            year_cols = [str(year) for year in range(2001, 2020)]
-            available_years = [col for col in year_cols if col in df.columns]
-            
-            if len(available_years) == 0:
-                print(f"    No year columns found for {state}")
-                continue
-                
-            df = df[['GeoFIPS', 'GeoName', 'LineCode', 'Description'] + available_years]
-            all_data.append(df)
-            
-        except Exception as e:
-            print(f"  Error processing {file_path}: {e}")
-            continue
+    all_data = load_bea_files(cagdp1_files, range(2001, 2020), [1, 2])
     
     if not all_data:
         raise ValueError("No CAGDP1 data loaded")
@@ -152,6 +120,38 @@ def load_and_process_cagdp1_data(input_dir):
     
     return combined_df
 
+def _linecodes_to_long(df, value_vars, linecodes, value_names):
+    """Align LineCode rows of a wide BEA table into one (GeoFIPS, GeoName, Year) record per row
+
+    Equivalent to melting the year columns and pivoting LineCode back out with
+    pivot_table(aggfunc='first'), but works on a (geographies, years, linecodes) array so no
+    long intermediate is built: duplicates keep their first non-null value and records with
+    no value for any LineCode are dropped.
+    """
+    geo_codes, geo_keys = pd.MultiIndex.from_arrays([df['GeoFIPS'], df['GeoName']]).factorize(sort=True)
+    years = np.array([int(col) for col in value_vars])
+    values = df[value_vars].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=np.float64)
+    
+    cube = np.full((len(geo_keys), len(years), len(linecodes)), np.nan)
+    line = df['LineCode'].to_numpy()
+    for k, code in enumerate(linecodes):
+        sel = np.flatnonzero(line == code)[::-1]  # reversed so the first row wins on duplicates
+        rows, cols = np.nonzero(~np.isnan(values[sel]))  # NaN cells never overwrite a value
+        cube[geo_codes[sel[rows]], cols, k] = values[sel[rows], cols]
+    
+    flat = cube.reshape(-1, len(linecodes))
+    keep = ~np.isnan(flat).all(axis=1)
+    geo_ix = np.repeat(np.arange(len(geo_keys)), len(years))[keep]
+    
+    long_df = pd.DataFrame({
+        'GeoFIPS': geo_keys.get_level_values(0)[geo_ix],
+        'GeoName': geo_keys.get_level_values(1)[geo_ix],
+        'Year': np.tile(years, len(geo_keys))[keep],
+    })
+    for k, name in enumerate(value_names):
+        long_df[name] = flat[keep, k]
+    return long_df
+
 def reshape_cainc1_to_long(cainc1_df):
     """Reshape CAINC1 data from wide to long format"""
     print("Reshaping CAINC1 data to long format...")
@@ -159,38 +159,13 @@ def reshape_cainc1_to_long(cainc1_df):
     if len(cainc1_df) == 0:
         raise ValueError("No data to reshape")
     
-    id_vars = ['GeoFIPS', 'GeoName', 'LineCode', 'Description']
     value_vars = [col for col in cainc1_df.columns if col.isdigit() and 1999 <= int(col) <= 2019]
     
     if not value_vars:
         raise ValueError("No year columns found in CAINC1 data")
     
-    long_df = cainc1_df.melt(
-        id_vars=id_vars,
-        value_vars=value_vars,
-        var_name='Year',
-        value_name='Value'
-    )
-    
-    long_df['Year'] = long_df['Year'].astype(int)
-    
-    pivot_df = long_df.pivot_table(
-        index=['GeoFIPS', 'GeoName', 'Year'],
-        columns='LineCode',
-        values='Value',
-        aggfunc='first'
-    ).reset_index()
-    
-    expected_columns = ['GeoFIPS', 'GeoName', 'Year', 1, 2, 3]
-    for col in expected_columns:
-        if col not in pivot_df.columns:
-            pivot_df[col] = np.nan
-    
-    pivot_df.columns = ['GeoFIPS', 'GeoName', 'Year', 'Personal_Income', 'Population', 'Per_Capita_Income']
-    
-    pivot_df['Personal_Income'] = pd.to_numeric(pivot_df['Personal_Income'], errors='coerce')
-    pivot_df['Population'] = pd.to_numeric(pivot_df['Population'], errors='coerce')
-    pivot_df['Per_Capita_Income'] = pd.to_numeric(pivot_df['Per_Capita_Income'], errors='coerce')
+    pivot_df = _linecodes_to_long(cainc1_df, value_vars, [1, 2, 3],
+                                  ['Personal_Income', 'Population', 'Per_Capita_Income'])
     
     print(f"  Reshaped to {len(pivot_df)} county-year records")
     return pivot_df
@@ -202,37 +177,12 @@ def reshape_cagdp1_to_long(cagdp1_df):
     if len(cagdp1_df) == 0:
         raise ValueError("No data to reshape")
     
-    id_vars = ['GeoFIPS', 'GeoName', 'LineCode', 'Description']
     value_vars = [col for col in cagdp1_df.columns if col.isdigit() and 2001 <= int(col) <= 2019]
     
     if not value_vars:
         raise ValueError("No year columns found in CAGDP1 data")
     
-    long_df = cagdp1_df.melt(
-        id_vars=id_vars,
-        value_vars=value_vars,
-        var_name='Year',
-        value_name='Value'
-    )
-    
-    long_df['Year'] = long_df['Year'].astype(int)
-    
-    pivot_df = long_df.pivot_table(
-        index=['GeoFIPS', 'GeoName', 'Year'],
-        columns='LineCode',
-        values='Value',
-        aggfunc='first'
-    ).reset_index()
-    
-    expected_columns = ['GeoFIPS', 'GeoName', 'Year', 1, 2]
-    for col in expected_columns:
-        if col not in pivot_df.columns:
-            pivot_df[col] = np.nan
-    
-    pivot_df.columns = ['GeoFIPS', 'GeoName', 'Year', 'Real_GDP', 'Current_Dollar_GDP']
-    
-    pivot_df['Real_GDP'] = pd.to_numeric(pivot_df['Real_GDP'], errors='coerce')
-    pivot_df['Current_Dollar_GDP'] = pd.to_numeric(pivot_df['Current_Dollar_GDP'], errors='coerce')
+    pivot_df = _linecodes_to_long(cagdp1_df, value_vars, [1, 2], ['Real_GDP', 'Current_Dollar_GDP'])
     
     print(f"  Reshaped to {len(pivot_df)} county-year records")
     return pivot_df
@@ -248,12 +198,10 @@ def merge_economic_data(cainc1_long, cagdp1_long):
         how='left'
     )
     
-    merged_df['State_FIPS'] = merged_df['GeoFIPS'].str[:2]
-    merged_df['County_FIPS'] = merged_df['GeoFIPS'].str[2:]
     merged_df['County'] = merged_df['GeoName'].str.replace(r', [A-Z]{2}$', '', regex=True)
     
     final_columns = [
-        'GeoFIPS', 'County', 'State_FIPS', 'County_FIPS', 'Year',
+        'GeoFIPS', 'County', 'Year',
         'Personal_Income', 'Population', 'Per_Capita_Income',
         'Real_GDP', 'Current_Dollar_GDP'
     ]
@@ -272,12 +220,13 @@ def clean_and_validate_data(merged_df):
     merged_df = merged_df.dropna(subset=['GeoFIPS'])
     
     # Filter for valid 5-digit FIPS codes and remove state/national summaries
-    merged_df = merged_df[merged_df['GeoFIPS'].str.match(r'^\d{5}$')]
-    merged_df = merged_df[~merged_df['GeoFIPS'].str.endswith('000')]
+    merged_df = merged_df[merged_df['GeoFIPS'].str.match(r'^\d{5}$')].copy()
 
-    merged_df['GeoFIPS'] = merged_df['GeoFIPS'].astype(str).str.zfill(5)
-    merged_df['State_FIPS'] = merged_df['State_FIPS'].astype(str).str.zfill(2)
-    merged_df['County_FIPS'] = merged_df['County_FIPS'].astype(str).str.zfill(3)
+    # Keep FIPS parts as integers; they are formatted as strings only on output
+    fips_int = merged_df['GeoFIPS'].astype(np.int32)
+    merged_df['State_FIPS'] = (fips_int // 1000).astype(np.int32)
+    merged_df['County_FIPS'] = (fips_int % 1000).astype(np.int32)
+    merged_df = merged_df[merged_df['County_FIPS'] != 0]
     
     merged_df['Personal_Income'] = merged_df['Personal_Income'].fillna(0)
     merged_df['Population'] = merged_df['Population'].fillna(0)
@@ -294,31 +243,63 @@ def optimize_economic_data(final_df):
     """Optimize economic data for statistical analysis"""
     print("\n=== Optimizing Economic Data for Statistical Analysis ===")
     
-    df = final_df.copy()
-    
+    # Build the narrow output frame from the needed columns instead of copying the wide one
     print("1. Creating 5-digit FIPS code...")
-    df['COUNTY_FIPS'] = df['State_FIPS'] + df['County_FIPS']
+    fips = (final_df['State_FIPS'] * 1000 + final_df['County_FIPS']).map('{:05d}'.format)
     
     print("2. Creating Total GDP in 10K USD...")
-    df['Total_GDP_10K_USD'] = df['Real_GDP'] / 10
-    df['Total_GDP_10K_USD'] = df['Total_GDP_10K_USD'].round(2)
+    gdp_10k = np.round(final_df['Real_GDP'].to_numpy(dtype=np.float64) / 10, 2)
     
     print("3. Converting data types...")
-    df['Population'] = df['Population'].astype(int)
-    df['Per_Capita_Income'] = df['Per_Capita_Income'].astype(int)
+    population = final_df['Population'].astype(int)
+    per_capita_income = final_df['Per_Capita_Income'].astype(int)
     
     print("4. Finalizing optimized dataset...")
     
-    final_cols = ['COUNTY_FIPS', 'Year', 'Population', 'Total_GDP_10K_USD', 'Per_Capita_Income']
-    
-    existing_cols = [col for col in final_cols if col in df.columns]
-    df = df[existing_cols]
+    df = pd.DataFrame({
+        'COUNTY_FIPS': fips,
+        'Year': final_df['Year'],
+        'Population': population,
+        'Total_GDP_10K_USD': gdp_10k,
+        'Per_Capita_Income': per_capita_income,
+    }, index=final_df.index)
     
     print(f"   Final dataset shape: {df.shape}")
     print(f"   Variables: {list(df.columns)}")
     
     return df
 
+def _backfill_interp(values, starts, limit):
+    """Backward-limited linear interpolation over contiguous group slices
+
+    Matches Series.interpolate(method='linear', limit_direction='backward', limit=limit)
+    applied per group: a NaN is filled only if a valid value follows within `limit`
+    positions; leading NaNs take that next valid value, trailing NaNs stay missing.
+    """
+    out = values.copy()
+    for g in range(len(starts) - 1):
+        lo = starts[g]
+        hi = starts[g + 1]
+        next_valid = -1
+        for i in range(hi - 1, lo - 1, -1):
+            if not np.isnan(values[i]):
+                next_valid = i
+                continue
+            if next_valid < 0 or next_valid - i > limit:
+                continue
+            prev_valid = i - 1
+            while prev_valid >= lo and np.isnan(values[prev_valid]):
+                prev_valid -= 1
+            if prev_valid < lo:
+                out[i] = values[next_valid]
+            else:
+                slope = (values[next_valid] - values[prev_valid]) / (next_valid - prev_valid)
+                out[i] = slope * (i - prev_valid) + values[prev_valid]
+    return out
+
+if njit is not None:
+    _backfill_interp = njit(cache=True)(_backfill_interp)
+
 def interpolate_gdp_data(merged_df):
     """Interpolate missing GDP data for 1999 and 2000"""
     print("Interpolating missing GDP data for 1999-2000...")
@@ -327,9 +308,13 @@ def interpolate_gdp_data(merged_df):
     
     merged_df = merged_df.sort_values(['GeoFIPS', 'Year'])
     
-    merged_df[gdp_cols] = merged_df.groupby('GeoFIPS')[gdp_cols].transform(
-        lambda x: x.interpolate(method='linear', limit_direction='backward', limit=2)
-    )
+    # Group boundaries of the sorted GeoFIPS runs
+    fips_codes, _ = pd.factorize(merged_df['GeoFIPS'])
+    starts = np.r_[0, np.flatnonzero(np.diff(fips_codes)) + 1, len(fips_codes)].astype(np.int64)
+    
+    for col in gdp_cols:
+        values = merged_df[col].to_numpy(dtype=np.float64)
+        merged_df[col] = _backfill_interp(values, starts, 2)
     
     print(f"  Interpolation complete.")
     return merged_df
@@ -352,7 +337,7 @@ def merge_bea_data(input_dir, output_dir):
         optimized_df = optimize_economic_data(cleaned_df)
         
         output_file = output_dir / "GDP.csv"
-        optimized_df.to_csv(output_file, index=False)
+        write_csv(pa.Table.from_pandas(optimized_df, preserve_index=False), output_file)
         
         print(f"\nOutput saved to: {output_file}")
         
@@ -364,7 +349,7 @@ def merge_bea_data(input_dir, output_dir):
 
 def main():
     """主函数"""
-    input_dir, output_dir = load_paths()
+    input_dir, output_dir = get_paths('socioeconomic', 'bea')
     
     merged_data = merge_bea_data(input_dir, output_dir)
     
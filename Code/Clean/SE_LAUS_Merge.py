@@ -7,123 +7,137 @@ LAUS 失业率数据合并脚本
 - 处理1999-2019年的失业率数据
 """
 
-import sys
-from pathlib import Path
+import gc
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
-import yaml
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+from _paths import get_paths
+from _csv_output import write_csv
+from _excel import read_excel_typed
 
-def load_paths():
-    """从config.yaml加载路径"""
-    project_root = Path(__file__).resolve().parents[2]
-    config_path = project_root / "config.yaml"
-    if not config_path.exists():
-        sys.exit(f"ERROR: Configuration file not found: {config_path}")
+# 可选：DuckDB（列式SQL引擎，用于最终的排序和CSV写出）
+try:
+    import duckdb  # type: ignore
+except Exception:
+    duckdb = None
 
-    with config_path.open("r", encoding="utf-8") as f:
-        cfg = yaml.safe_load(f)
+# LAUS 文件中需要读取的列
+LAUS_COLUMNS = ['State FIPS Code', 'County FIPS Code', 'Labor Force', 'Employed', 'Unemployed', 'Unemployment Rate (%)']
+# 数值列在读取时直接转换类型（FIPS代码在部分年份为文本单元格，仍单独处理）
+LAUS_DTYPES = {'Labor Force': 'Int64', 'Employed': 'Int64', 'Unemployed': 'Int64', 'Unemployment Rate (%)': 'float64'}
 
+def _load_year(year, input_dir):
+    """读取并清洗单个年份的 LAUS 文件，失败或缺失时返回 None"""
+    # 修复文件命名规则：1999年是99，2000-2009年是00-09，2010+是10-24
+    if year == 1999:
+        year_str = "99"
+    elif year < 2010:
+        year_str = f"0{year % 100}"
+    else:
+        year_str = str(year % 100)
+        
+    file_path = input_dir / f"laucnty{year_str}.xlsx"
+    
+    if not file_path.exists():
+        print(f"警告: 文件 {file_path} 不存在，跳过")
+        return None
+        
+    print(f"处理 {year} 年数据...")
+    
     try:
-        laus_config = cfg["data_sources"]["socioeconomic"]["laus"]
-        input_rel = laus_config["original"]
-        output_rel = laus_config["processed"]
-    except (KeyError, TypeError):
-        sys.exit("ERROR: config.yaml is missing the required path for data_sources.socioeconomic.laus")
-
-    input_dir = (project_root / input_rel).resolve()
-    output_dir = (project_root / output_rel).resolve()
-
-    if not input_dir.exists():
-        sys.exit(f"ERROR: Input directory not found: {input_dir}")
+        # 读取Excel文件，使用第2行作为列名，只解析需要的列，数值列在读取时完成类型转换
+        df = read_excel_typed(file_path, LAUS_DTYPES, header=1, usecols=LAUS_COLUMNS)
+        
+        # 添加年份列
+        df['Year'] = year
+        
+        # 标准化FIPS代码 - 以整数计算（州*1000+县），输出时再格式化为5位字符串
+        state_fips = pd.to_numeric(df['State FIPS Code'], errors='coerce').fillna(0).astype(np.int32)
+        county_fips = pd.to_numeric(df['County FIPS Code'], errors='coerce').fillna(0).astype(np.int32)
+        df['COUNTY_FIPS'] = state_fips * 1000 + county_fips
+        
+        # 选择需要的列并重命名
+        df_clean = df[['COUNTY_FIPS', 'Year', 'Labor Force', 'Employed', 'Unemployed', 'Unemployment Rate (%)']].copy()
+        df_clean.columns = ['COUNTY_FIPS', 'Year', 'Labor_Force', 'Employed', 'Unemployed', 'Unemployment_Rate']
+        # 原始表格不再需要，及时释放
+        del df
+        
+        # 过滤掉无效的FIPS代码（汇总行或缺失行的FIPS为00000）
+        df_clean = df_clean[df_clean['COUNTY_FIPS'] != 0]
+        
+        print(f"  ✅ {year} 年成功处理，{len(df_clean)} 行")
+        return df_clean
+        
+    except Exception as e:
+        print(f"  ❌ 处理 {year} 年数据时出错: {e}")
+        return None
 
-    output_dir.mkdir(parents=True, exist_ok=True)
-    return input_dir, output_dir
+def finalize_with_duckdb(table, output_file):
+    """用DuckDB对合并结果排序、将FIPS格式化为5位字符串并直接写出CSV，返回结果表"""
+    con = duckdb.connect()
+    try:
+        con.register('laus', table)
+        con.execute("""
+            CREATE TEMP TABLE result AS
+            SELECT * REPLACE (lpad(CAST(COUNTY_FIPS AS VARCHAR), 5, '0') AS COUNTY_FIPS) FROM laus
+            ORDER BY laus.COUNTY_FIPS, Year
+        """)
+        output_path = str(output_file).replace("'", "''")
+        con.execute(f"COPY result TO '{output_path}' (HEADER, DELIMITER ',')")
+        return con.table('result').fetch_arrow_table()
+    finally:
+        con.close()
 
 def merge_laus_data(input_dir, output_dir):
     """合并 LAUS 数据"""
     print(f"开始合并 LAUS 数据文件夹: {input_dir}")
     
-    # 获取1999-2019年的文件列表
-    years = range(1999, 2020)
-    all_data = []
-    
-    for year in years:
-        # 修复文件命名规则：1999年是99，2000-2009年是00-09，2010+是10-24
-        if year == 1999:
-            year_str = "99"
-        elif year < 2010:
-            year_str = f"0{year % 100}"
-        else:
-            year_str = str(year % 100)
-            
-        file_path = input_dir / f"laucnty{year_str}.xlsx"
-        
-        if not file_path.exists():
-            print(f"警告: 文件 {file_path} 不存在，跳过")
-            continue
-            
-        print(f"处理 {year} 年数据...")
-        
-        try:
-            # 读取Excel文件，使用第2行作为列名
-            df = pd.read_excel(file_path, header=1)
-            
-            # 添加年份列
-            df['Year'] = year
-            
-            # 标准化FIPS代码 - 处理浮点数格式和缺失值
-            state_fips = df['State FIPS Code'].fillna(0).astype(float).astype(int).astype(str).str.zfill(2)
-            county_fips = df['County FIPS Code'].fillna(0).astype(float).astype(int).astype(str).str.zfill(3)
-            df['COUNTY_FIPS'] = state_fips + county_fips
-            
-            # 选择需要的列并重命名
-            df_clean = df[['COUNTY_FIPS', 'Year', 'Labor Force', 'Employed', 'Unemployed', 'Unemployment Rate (%)']].copy()
-            df_clean.columns = ['COUNTY_FIPS', 'Year', 'Labor_Force', 'Employed', 'Unemployed', 'Unemployment_Rate']
-            
-            # 数据类型转换
-            numeric_cols = ['Labor_Force', 'Employed', 'Unemployed', 'Unemployment_Rate']
-            for col in numeric_cols:
-                if col in ['Labor_Force', 'Employed', 'Unemployed']:
-                    # 劳动力、就业、失业人数转换为整数
-                    df_clean[col] = pd.to_numeric(df_clean[col], errors='coerce').astype('Int64')
-                else:
-                    # 失业率保持浮点数
-                    df_clean[col] = pd.to_numeric(df_clean[col], errors='coerce')
-            
-            # 过滤掉无效的FIPS代码（通常以'CN'开头的是汇总行，或者FIPS为00000）
-            df_clean = df_clean[~df_clean['COUNTY_FIPS'].str.startswith('CN', na=False)]
-            df_clean = df_clean[df_clean['COUNTY_FIPS'] != '00000']
-            
-            all_data.append(df_clean)
-            print(f"  ✅ 成功处理，{len(df_clean)} 行")
-            
-        except Exception as e:
-            print(f"  ❌ 处理 {year} 年数据时出错: {e}")
-            continue
+    # 获取1999-2019年的文件列表，各年份在独立进程中并行读取（结果保持年份顺序）
+    years = list(range(1999, 2020))
+    # 每个年份的结果立即转为Arrow表并释放DataFrame，最后零拷贝拼接，避免 pandas concat 复制整张表
+    tables = []
+    with ProcessPoolExecutor() as executor:
+        for i, df in enumerate(executor.map(_load_year, years, [input_dir] * len(years)), 1):
+            if df is not None:
+                tables.append(pa.Table.from_pandas(df, preserve_index=False))
+            del df
+            if i % 5 == 0:
+                gc.collect()
     
-    if not all_data:
+    if not tables:
         print("错误: 没有成功读取任何数据文件")
         return None
     
     # 合并所有年份的数据
     print("合并所有年份数据...")
-    combined_df = pd.concat(all_data, ignore_index=True)
-    
-    # 排序
-    combined_df = combined_df.sort_values(['COUNTY_FIPS', 'Year'])
-    
-    print(f"合并完成，总共 {len(combined_df)} 行")
+    table = pa.concat_tables(tables)
+    del tables
     
-    # 保存合并后的数据
     output_file = output_dir / "Unemployment.csv"
-    combined_df.to_csv(output_file, index=False)
+    if duckdb is not None:
+        # 排序、FIPS格式化与写出交给DuckDB
+        print("使用DuckDB排序并写出...")
+        table = finalize_with_duckdb(table, output_file)
+    else:
+        # 排序（整数FIPS的顺序与5位字符串一致），排序后再格式化为5位字符串
+        table = table.sort_by([('COUNTY_FIPS', 'ascending'), ('Year', 'ascending')])
+        fips = pc.utf8_lpad(pc.cast(table['COUNTY_FIPS'], pa.string()), 5, padding='0')
+        table = table.set_column(table.schema.get_field_index('COUNTY_FIPS'), 'COUNTY_FIPS', fips)
+        
+        # 保存合并后的数据
+        write_csv(table, output_file)
+    
+    print(f"合并完成，总共 {table.num_rows} 行")
     print(f"数据已保存到: {output_file}")
     
-    return combined_df
+    return table.to_pandas(self_destruct=True)
 
 def main():
     """主函数"""
     # 加载路径
-    input_dir, output_dir = load_paths()
+    input_dir, output_dir = get_paths('socioeconomic', 'laus')
     
     # 合并数据
     merged_data = merge_laus_data(input_dir, output_dir)
@@ -7,40 +7,32 @@ SAIPE 贫困和收入数据合并脚本
 - 支持.dat文件（1999-2002）和Excel文件（2003-2019）
 """
 
-import sys
-from pathlib import Path
+import argparse
+import gc
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 import pandas as pd
-import os
-import yaml
+import pyarrow as pa
+from _paths import get_paths
+from _csv_output import write_csv
+from _excel import read_excel_typed
 
-def load_paths():
-    """从config.yaml加载路径"""
-    project_root = Path(__file__).resolve().parents[2]
-    config_path = project_root / "config.yaml"
-    if not config_path.exists():
-        sys.exit(f"ERROR: Configuration file not found: {config_path}")
+# 可选：DuckDB（列式SQL引擎，用于最终的去重、排序和CSV写出）
+try:
+    import duckdb  # type: ignore
+except Exception:
+    duckdb = None
 
-    with config_path.open("r", encoding="utf-8") as f:
-        cfg = yaml.safe_load(f)
+# est{yy}all.dat 的固定宽度布局（SAIPE 县/州估计文件说明，列号从1开始）：
+# 1-2 州FIPS，4-6 县FIPS，35-38 全年龄贫困率，134-139 家庭收入中位数
+DAT_COLSPECS = [(0, 2), (3, 6), (34, 38), (133, 139)]
+DAT_COLUMNS = ['State_FIPS', 'County_FIPS', 'Poverty_Percent_All_Ages', 'Median_Household_Income']
 
-    try:
-        saipe_config = cfg["data_sources"]["socioeconomic"]["saipe"]
-        input_rel = saipe_config["original"]
-        output_rel = saipe_config["processed"]
-    except (KeyError, TypeError):
-        sys.exit("ERROR: config.yaml is missing the required path for data_sources.socioeconomic.saipe")
-
-    input_dir = (project_root / input_rel).resolve()
-    output_dir = (project_root / output_rel).resolve()
-
-    if not input_dir.exists():
-        sys.exit(f"ERROR: Input directory not found: {input_dir}")
+# Excel解析缓存的版本号：修改 process_excel_file 的清洗逻辑或输出列类型时递增，旧缓存随之失效
+CACHE_VERSION = 2
 
-    output_dir.mkdir(parents=True, exist_ok=True)
-    return input_dir, output_dir
-
-def parse_dat_file(file_path, year):
-    """解析固定宽度格式的.dat文件（1999-2002年）"""
+def parse_dat_file_heuristic(file_path, year):
+    """逐行启发式解析.dat文件（固定宽度布局不匹配时的回退方案）"""
     data = []
     
     with open(file_path, 'r') as f:
@@ -108,6 +100,31 @@ def parse_dat_file(file_path, year):
     
     return pd.DataFrame(data)
 
+def parse_dat_file(file_path, year):
+    """按固定宽度列位置解析.dat文件（1999-2002年）"""
+    raw = pd.read_fwf(file_path, colspecs=DAT_COLSPECS, names=list(DAT_COLUMNS), header=None, dtype=str)
+    state_fips = pd.to_numeric(raw['State_FIPS'], errors='coerce')
+    county_fips = pd.to_numeric(raw['County_FIPS'], errors='coerce')
+    poverty_rate = pd.to_numeric(raw['Poverty_Percent_All_Ages'], errors='coerce')
+    median_income = pd.to_numeric(raw['Median_Household_Income'].str.replace(',', ''), errors='coerce')
+    
+    # 县级记录（县FIPS为0的是州级/全国汇总）
+    is_county = state_fips.notna() & county_fips.notna() & (county_fips != 0)
+    valid = is_county & poverty_rate.between(0, 100) & (median_income > 0)
+    
+    # 布局与说明不符时（大部分县级记录解析不出有效值），回退到启发式解析
+    if is_county.sum() == 0 or valid.sum() < 0.9 * is_county.sum():
+        print(f"    - {year} 年固定宽度解析结果异常，改用逐行启发式解析")
+        return parse_dat_file_heuristic(file_path, year)
+    
+    fips = state_fips[valid].astype(int) * 1000 + county_fips[valid].astype(int)
+    return pd.DataFrame({
+        'COUNTY_FIPS': fips.map('{:05d}'.format),
+        'Year': year,
+        'Poverty_Percent_All_Ages': poverty_rate[valid].astype(float),
+        'Median_Household_Income': median_income[valid].astype(int),
+    }).reset_index(drop=True)
+
 def process_excel_file(file_path, year):
     """智能处理Excel文件，适应不同年份的不同格式"""
     try:
@@ -140,11 +157,12 @@ def process_excel_file(file_path, year):
             print(f"    - 未知年份格式: {year}")
             return None
         
-        # 读取Excel文件
-        df = pd.read_excel(file_path, header=header_row)
+        # 读取Excel文件，只解析需要的列，贫困率和收入在读取时完成类型转换
+        required_cols = [state_col, county_col, poverty_col, income_col]
+        df = read_excel_typed(file_path, {poverty_col: 'float64', income_col: 'Int64'},
+                              header=header_row, usecols=lambda col: col in required_cols)
         
         # 检查必要的列是否存在
-        required_cols = [state_col, county_col, poverty_col, income_col]
         missing_cols = [col for col in required_cols if col not in df.columns]
         if missing_cols:
             print(f"    - 缺少必要的列: {missing_cols}")
@@ -168,14 +186,12 @@ def process_excel_file(file_path, year):
         # 选择需要的列并重命名
         df_clean = df[['COUNTY_FIPS', 'Year', poverty_col, income_col]].copy()
         df_clean.columns = ['COUNTY_FIPS', 'Year', 'Poverty_Percent_All_Ages', 'Median_Household_Income']
+        # 原始表格不再需要，及时释放
+        del df
         
         # 过滤掉州级汇总数据
         df_clean = df_clean[df_clean['COUNTY_FIPS'].str[-3:] != '000']
         
-        # 数据类型转换
-        df_clean['Poverty_Percent_All_Ages'] = pd.to_numeric(df_clean['Poverty_Percent_All_Ages'], errors='coerce')
-        df_clean['Median_Household_Income'] = pd.to_numeric(df_clean['Median_Household_Income'], errors='coerce')
-        
         # 过滤掉无效数据
         df_clean = df_clean[
             (df_clean['Poverty_Percent_All_Ages'].notna()) & 
@@ -194,77 +210,131 @@ def process_excel_file(file_path, year):
         print(f"    - 处理Excel文件失败: {e}")
         return None
 
-def merge_saipe_data(input_dir, output_dir):
-    """合并 SAIPE 数据"""
-    print(f"开始合并 SAIPE 数据文件夹: {input_dir}")
+def load_excel_cached(file_path, year, cache_dir, force=False):
+    """解析Excel文件并把清洗结果缓存为Parquet；缓存版本一致、比源文件新且未指定force时直接读取缓存"""
+    cache_file = cache_dir / f"{file_path.stem}.v{CACHE_VERSION}.parquet"
+    if not force and cache_file.exists() and cache_file.stat().st_mtime > file_path.stat().st_mtime:
+        print(f"    - 使用缓存: {cache_file.name}")
+        return pd.read_parquet(cache_file)
     
-    # 获取1999-2019年的文件列表
-    years = range(1999, 2020)
-    all_data = []
+    df_clean = process_excel_file(file_path, year)
+    if df_clean is not None and not df_clean.empty:
+        df_clean.to_parquet(cache_file, compression='zstd', index=False)
+    return df_clean
+
+def _load_year(year, input_dir, cache_dir, force=False):
+    """读取单个年份的 SAIPE 文件（.dat 或 Excel），失败或缺失时返回 None"""
+    print(f"处理 {year} 年数据...")
     
-    for year in years:
-        print(f"处理 {year} 年数据...")
-        
-        # 处理.dat文件（1999-2002年）
-        if year <= 2002:
-            file_path = input_dir / f"est{str(year)[-2:]}all.dat"
-            if file_path.exists():
-                try:
-                    df = parse_dat_file(file_path, year)
-                    if not df.empty:
-                        all_data.append(df)
-                        print(f"  - 成功解析 {len(df)} 条记录")
-                    else:
-                        print(f"  - 警告: 没有解析到有效数据")
-                except Exception as e:
-                    print(f"  - 错误: 解析.dat文件失败 - {e}")
-            else:
-                print(f"  - 警告: 文件 {file_path} 不存在")
-            continue
-        else:
-            # .xls文件（Excel格式）
-            file_path = input_dir / f"est{str(year)[-2:]}all.xls"
-            if file_path.exists():
-                df_clean = process_excel_file(file_path, year)
-                if df_clean is not None and not df_clean.empty:
-                    all_data.append(df_clean)
-                    print(f"  - 成功解析 {len(df_clean)} 条记录")
-                else:
-                    print(f"  - 警告: 没有解析到有效数据")
-            else:
-                print(f"  - 警告: 文件 {file_path} 不存在")
+    # 处理.dat文件（1999-2002年）
+    if year <= 2002:
+        file_path = input_dir / f"est{str(year)[-2:]}all.dat"
+        if not file_path.exists():
+            print(f"  - 警告: 文件 {file_path} 不存在")
+            return None
+        try:
+            df = parse_dat_file(file_path, year)
+        except Exception as e:
+            print(f"  - 错误: 解析.dat文件失败 - {e}")
+            return None
+    else:
+        # .xls文件（Excel格式）
+        file_path = input_dir / f"est{str(year)[-2:]}all.xls"
+        if not file_path.exists():
+            print(f"  - 警告: 文件 {file_path} 不存在")
+            return None
+        df = load_excel_cached(file_path, year, cache_dir, force)
     
-    if not all_data:
-        print("错误: 没有成功读取任何数据文件")
+    if df is None or df.empty:
+        print(f"  - 警告: {year} 年没有解析到有效数据")
         return None
+    print(f"  - {year} 年成功解析 {len(df)} 条记录")
+    return df
+
+def finalize_with_duckdb(table, output_file):
+    """用DuckDB对合并结果去重（每个县-年份保留第一条）、排序并直接写出CSV，返回结果表"""
+    con = duckdb.connect()
+    try:
+        # 附加行号列，保证"保留第一条"与拼接顺序一致
+        con.register('saipe', table.append_column('_row', pa.array(range(table.num_rows), pa.int64())))
+        con.execute("""
+            CREATE TEMP TABLE result AS
+            SELECT * EXCLUDE (_row) FROM saipe
+            QUALIFY row_number() OVER (PARTITION BY COUNTY_FIPS, Year ORDER BY _row) = 1
+            ORDER BY COUNTY_FIPS, Year
+        """)
+        output_path = str(output_file).replace("'", "''")
+        con.execute(f"COPY result TO '{output_path}' (HEADER, DELIMITER ',')")
+        return con.table('result').fetch_arrow_table()
+    finally:
+        con.close()
+
+def merge_saipe_data(input_dir, output_dir, force=False):
+    """合并 SAIPE 数据（force=True 时忽略Excel解析缓存）"""
+    print(f"开始合并 SAIPE 数据文件夹: {input_dir}")
     
-    # 合并所有年份的数据
-    print("合并所有年份数据...")
-    combined_df = pd.concat(all_data, ignore_index=True)
+    # Excel解析结果缓存目录
+    cache_dir = output_dir / "_cache"
+    cache_dir.mkdir(parents=True, exist_ok=True)
     
-    # 去除重复记录
-    print("去除重复记录...")
-    combined_df = combined_df.drop_duplicates(subset=['COUNTY_FIPS', 'Year'])
+    # 获取1999-2019年的文件列表，各年份在独立进程中并行读取（结果保持年份顺序）
+    years = list(range(1999, 2020))
+    worker = partial(_load_year, input_dir=input_dir, cache_dir=cache_dir, force=force)
+    # 每个年份的结果立即转为Arrow表并释放DataFrame，最后零拷贝拼接，避免 pandas concat 复制整张表
+    tables = []
+    with ProcessPoolExecutor() as executor:
+        for i, df in enumerate(executor.map(worker, years), 1):
+            if df is not None:
+                tables.append(pa.Table.from_pandas(df, preserve_index=False))
+            del df
+            if i % 5 == 0:
+                gc.collect()
     
-    # 排序
-    combined_df = combined_df.sort_values(['COUNTY_FIPS', 'Year'])
+    if not tables:
+        print("错误: 没有成功读取任何数据文件")
+        return None
     
-    print(f"合并完成，总共 {len(combined_df)} 行")
+    # 合并所有年份的数据（收入列在.dat年份为int64、Excel年份为可空Int64，permissive用于统一两者的schema差异）
+    print("合并所有年份数据...")
+    table = pa.concat_tables(tables, promote_options='permissive')
+    del tables
     
-    # 保存合并后的数据
     output_file = output_dir / "Poverty_Income.csv"
-    combined_df.to_csv(output_file, index=False)
+    if duckdb is not None:
+        # 去重、排序与写出交给DuckDB
+        print("使用DuckDB去除重复记录并排序...")
+        table = finalize_with_duckdb(table, output_file)
+    else:
+        # 去除重复记录（保留第一条）
+        print("去除重复记录...")
+        duplicated = table.select(['COUNTY_FIPS', 'Year']).to_pandas().duplicated().to_numpy()
+        table = table.filter(pa.array(~duplicated))
+        
+        # 排序
+        table = table.sort_by([('COUNTY_FIPS', 'ascending'), ('Year', 'ascending')])
+        
+        # 保存合并后的数据
+        write_csv(table, output_file)
+    
+    print(f"合并完成，总共 {table.num_rows} 行")
     print(f"数据已保存到: {output_file}")
     
-    return combined_df
+    return table.to_pandas(self_destruct=True)
 
-def main():
-    """主函数"""
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="合并 SAIPE 贫困和收入数据")
+    parser.add_argument("--force", action="store_true", help="忽略Excel解析缓存，重新解析所有文件")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    """主函数（argv 为 None 时读取命令行参数）"""
+    args = parse_args(argv)
+    
     # 加载路径
-    input_dir, output_dir = load_paths()
+    input_dir, output_dir = get_paths('socioeconomic', 'saipe')
     
     # 合并数据
-    merged_data = merge_saipe_data(input_dir, output_dir)
+    merged_data = merge_saipe_data(input_dir, output_dir, force=args.force)
     
     if merged_data is not None:
         print("\nSAIPE 数据合并成功!")
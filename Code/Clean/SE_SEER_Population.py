@@ -1,14 +1,20 @@
+import collections
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
-import yaml
 from pathlib import Path
 import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from _paths import load_config
+from _csv_output import open_csv_writer
 
-def load_config():
-    """Load configuration from config.yaml"""
-    # The script is in WDP/Code/Clean, so config.yaml is 2 levels up
-    config_path = Path(__file__).resolve().parents[2] / 'config.yaml'
-    with open(config_path, 'r') as f:
-        return yaml.safe_load(f)
+# Optional: numba compiles the fixed-width digit decoder (NumPy string casts otherwise)
+try:
+    from numba import njit  # type: ignore
+except Exception:  # pragma: no cover
+    njit = None
 
 def parse_seer_population_record(line):
     """
@@ -43,6 +49,114 @@ def parse_seer_population_record(line):
     
     return record
 
+# Records parsed and written per chunk
+CHUNK_RECORDS = 1_000_000
+
+# Output format: 'parquet' (zstd, compact integer columns) or 'csv'
+OUTPUT_FORMAT = 'parquet'
+
+# Columns of Population_Structure, written chunk by chunk
+OUTPUT_SCHEMA = pa.schema([
+    ('COUNTY_FIPS', pa.string()),
+    ('Year', pa.int16()),
+    ('Race', pa.int8()),
+    ('Origin', pa.int8()),
+    ('Sex', pa.int8()),
+    ('Age', pa.int8()),
+    ('Population', pa.int32()),
+])
+
+# Fixed length record layout (26 bytes plus the line terminator), see parse_seer_population_record
+SEER_RECORD_DTYPE = np.dtype([
+    ('Year', 'S4'),
+    ('State', 'S2'),
+    ('State_FIPS', 'S2'),
+    ('County_FIPS', 'S3'),
+    ('Registry', 'S2'),
+    ('Race', 'S1'),
+    ('Origin', 'S1'),
+    ('Sex', 'S1'),
+    ('Age', 'S2'),
+    ('Population', 'S8'),
+    ('Newline', 'S1'),
+])
+
+# Numeric fields decoded by the compiled kernel: (name, start, stop) byte offsets in a record
+NUMERIC_FIELDS = [
+    ('Year', 0, 4),
+    ('State_FIPS', 6, 8),
+    ('County_FIPS', 8, 11),
+    ('Race', 13, 14),
+    ('Origin', 14, 15),
+    ('Sex', 15, 16),
+    ('Age', 16, 18),
+    ('Population', 18, 26),
+]
+FIELD_STARTS = np.array([start for _, start, _ in NUMERIC_FIELDS], dtype=np.int64)
+FIELD_STOPS = np.array([stop for _, _, stop in NUMERIC_FIELDS], dtype=np.int64)
+
+def _decode_fields(buf, starts, stops, out):
+    """
+    Decode ASCII digit fields of fixed-width records (one uint8 row per record) into out.
+    
+    Spaces are skipped as padding. Returns the index of the first record holding a
+    non-digit character, or -1 if every record decoded cleanly.
+    """
+    for i in range(buf.shape[0]):
+        for k in range(starts.shape[0]):
+            value = 0
+            for j in range(starts[k], stops[k]):
+                c = buf[i, j]
+                if c == 32:
+                    continue
+                if c < 48 or c > 57:
+                    return i
+                value = value * 10 + (c - 48)
+            out[i, k] = value
+    return -1
+
+if njit is not None:
+    _decode_fields = njit(cache=True)(_decode_fields)
+
+def parse_seer_population_block(raw):
+    """
+    Vectorized parse of an array of SEER records (SEER_RECORD_DTYPE) into a DataFrame.
+    
+    Hurricane evacuee records (9-filled state or county FIPS) are dropped.
+    Raises ValueError if a record holds a non-numeric field.
+    """
+    if njit is None:
+        raw = raw[(raw['State_FIPS'] != b'99') & (raw['County_FIPS'] != b'999')]
+        return pd.DataFrame({
+            'COUNTY_FIPS': np.char.add(raw['State_FIPS'], raw['County_FIPS']).astype('U5'),
+            'Year': raw['Year'].astype(np.int64),
+            'Race': raw['Race'].astype(np.int64),
+            'Origin': raw['Origin'].astype(np.int64),
+            'Sex': raw['Sex'].astype(np.int64),
+            'Age': raw['Age'].astype(np.int64),
+            'Population': raw['Population'].astype(np.int64)
+        })
+    
+    # Compiled path: decode digits straight from the raw bytes in one pass
+    buf = np.ascontiguousarray(raw).view(np.uint8).reshape(len(raw), SEER_RECORD_DTYPE.itemsize)
+    values = np.empty((len(raw), len(NUMERIC_FIELDS)), dtype=np.int64)
+    bad = _decode_fields(buf, FIELD_STARTS, FIELD_STOPS, values)
+    if bad >= 0:
+        raise ValueError(f"non-numeric field in record {bad + 1} of block")
+    
+    keep = (values[:, 1] != 99) & (values[:, 2] != 999)
+    values = values[keep]
+    fips = np.ascontiguousarray(buf[keep, 6:11]).view('S5').ravel()
+    return pd.DataFrame({
+        'COUNTY_FIPS': fips.astype('U5'),
+        'Year': values[:, 0],
+        'Race': values[:, 3],
+        'Origin': values[:, 4],
+        'Sex': values[:, 5],
+        'Age': values[:, 6],
+        'Population': values[:, 7]
+    })
+
 def create_county_fips(state_fips, county_fips):
     """Create 5-digit county FIPS code"""
     # Handle special cases for hurricane evacuees (9-filled)
@@ -57,9 +171,112 @@ def create_county_fips(state_fips, county_fips):
     except:
         return None
 
+def parse_seer_population_lines(lines, first_line_no, error_count):
+    """
+    Line-by-line parse of SEER records, used when the fixed-width fast path does not apply.
+    
+    Returns (DataFrame, error_count) with error_count accumulated from the value passed in.
+    """
+    records = []
+    for line_no, line in enumerate(lines, start=first_line_no):
+        try:
+            record = parse_seer_population_record(line)
+            if record is None:
+                error_count += 1
+                continue
+            
+            # Create county FIPS
+            county_fips = create_county_fips(record['State_FIPS'], record['County_FIPS'])
+            if county_fips is None:
+                continue  # Skip hurricane evacuee records and invalid FIPS
+            
+            # Keep original codes, no decoding
+            records.append({
+                'COUNTY_FIPS': county_fips,
+                'Year': record['Year'],
+                'Race': record['Race'],
+                'Origin': record['Origin'],
+                'Sex': record['Sex'],
+                'Age': record['Age'],
+                'Population': record['Population']
+            })
+            
+        except Exception as e:
+            error_count += 1
+            if error_count <= 10:  # Only print first 10 errors
+                print(f"Error processing line {line_no}: {e}")
+            continue
+    
+    columns = ['COUNTY_FIPS', 'Year', 'Race', 'Origin', 'Sex', 'Age', 'Population']
+    return pd.DataFrame(records, columns=columns), error_count
+
+def _parse_record_range(input_file, start, stop):
+    """
+    Parse records [start, stop) of a uniform SEER file in a worker process.
+    
+    Returns (DataFrame, record_count, error_count); a range that fails the vectorized
+    parse is parsed line by line.
+    """
+    raw = np.memmap(input_file, dtype=SEER_RECORD_DTYPE, mode='r')[start:stop]
+    try:
+        return parse_seer_population_block(raw), len(raw), 0
+    except ValueError:
+        lines = raw.tobytes().decode('utf-8').splitlines(keepends=True)
+        df, error_count = parse_seer_population_lines(lines, start + 1, 0)
+        return df, len(raw), error_count
+
+def iter_seer_chunks(input_file):
+    """
+    Yield (DataFrame, lines_in_chunk, cumulative_error_count) for successive chunks of the file.
+    
+    Files made of uniform newline-terminated 26-byte records are split at record boundaries
+    into CHUNK_RECORDS ranges that worker processes memory-map and parse in parallel (chunks
+    are still yielded in file order); a file that is not uniform is parsed line by line.
+    """
+    error_count = 0
+    size = input_file.stat().st_size
+    uniform = size > 0 and size % SEER_RECORD_DTYPE.itemsize == 0
+    if uniform:
+        records = np.memmap(input_file, dtype=SEER_RECORD_DTYPE, mode='r')
+        uniform = bool((records['Newline'] == b'\n').all())
+        n_records = len(records)
+        del records
+    
+    if uniform:
+        workers = os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = (
+                executor.submit(_parse_record_range, input_file, start, min(start + CHUNK_RECORDS, n_records))
+                for start in range(0, n_records, CHUNK_RECORDS)
+            )
+            # Keep a bounded window of chunks in flight so parsed results do not pile up ahead of the writer
+            pending = collections.deque(itertools.islice(futures, 2 * workers))
+            while pending:
+                df, n_lines, chunk_errors = pending.popleft().result()
+                pending.extend(itertools.islice(futures, 1))
+                error_count += chunk_errors
+                yield df, n_lines, error_count
+        return
+    
+    with open(input_file, 'r', encoding='utf-8') as f:
+        line_no = 1
+        while True:
+            lines = list(itertools.islice(f, CHUNK_RECORDS))
+            if not lines:
+                break
+            df, error_count = parse_seer_population_lines(lines, line_no, error_count)
+            line_no += len(lines)
+            yield df, len(lines), error_count
+
+def open_output_writer(output_file):
+    """Open a chunk writer for OUTPUT_FORMAT (Parquet with zstd, or CSV)"""
+    if OUTPUT_FORMAT == 'csv':
+        return open_csv_writer(output_file, OUTPUT_SCHEMA)
+    return pq.ParquetWriter(str(output_file), OUTPUT_SCHEMA, compression='zstd')
+
 def process_seer_population_data(input_file, output_file):
     """
-    Process SEER population data from fixed-width format to CSV.
+    Process SEER population data from fixed-width format to Parquet (or CSV, see OUTPUT_FORMAT).
     
     Data Mappings:
     
@@ -88,86 +305,68 @@ def process_seer_population_data(input_file, output_file):
     print(f"Processing SEER population data from {input_file}")
     print(f"Output will be saved to {output_file}")
     
-    records = []
+    # Ensure output directory exists
+    output_file.parent.mkdir(parents=True, exist_ok=True)
+    
+    # Chunks are filtered to 1999-2020 and appended to the CSV as they are parsed,
+    # keeping only running totals for the summary
     line_count = 0
     error_count = 0
+    valid_count = 0
+    filtered_count = 0
+    population_total = 0
+    counties = set()
+    codes = {col: np.array([], dtype=np.int64) for col in ['Year', 'Race', 'Origin', 'Sex', 'Age']}
     
     try:
-        with open(input_file, 'r', encoding='utf-8') as f:
-            for line in f:
-                line_count += 1
-                
-                if line_count % 1000000 == 0:
-                    print(f"Processed {line_count:,} lines, {len(records):,} valid records")
+        with open_output_writer(output_file) as writer:
+            for df, n_lines, error_count in iter_seer_chunks(input_file):
+                line_count += n_lines
+                valid_count += len(df)
+                print(f"Processed {line_count:,} lines, {valid_count:,} valid records")
                 
-                try:
-                    record = parse_seer_population_record(line)
-                    if record is None:
-                        error_count += 1
-                        continue
-                    
-                    # Create county FIPS
-                    county_fips = create_county_fips(record['State_FIPS'], record['County_FIPS'])
-                    if county_fips is None:
-                        continue  # Skip hurricane evacuee records and invalid FIPS
-                    
-                    # Keep original codes, no decoding
-                    processed_record = {
-                        'COUNTY_FIPS': county_fips,
-                        'Year': record['Year'],
-                        'Race': record['Race'],
-                        'Origin': record['Origin'],
-                        'Sex': record['Sex'],
-                        'Age': record['Age'],
-                        'Population': record['Population']
-                    }
-                    
-                    records.append(processed_record)
-                    
-                except Exception as e:
-                    error_count += 1
-                    if error_count <= 10:  # Only print first 10 errors
-                        print(f"Error processing line {line_count}: {e}")
+                df = df[(df['Year'] >= 1999) & (df['Year'] <= 2020)]
+                if len(df) == 0:
                     continue
+                
+                writer.write_table(pa.Table.from_pandas(df, schema=OUTPUT_SCHEMA, preserve_index=False))
+                
+                filtered_count += len(df)
+                population_total += int(df['Population'].sum())
+                counties.update(df['COUNTY_FIPS'].unique())
+                for col in codes:
+                    codes[col] = np.union1d(codes[col], df[col].unique())
+                del df
     
     except Exception as e:
         print(f"Error reading file: {e}")
+        output_file.unlink(missing_ok=True)
         return False
     
     print(f"\nProcessing complete:")
     print(f"Total lines processed: {line_count:,}")
-    print(f"Valid records: {len(records):,}")
+    print(f"Valid records: {valid_count:,}")
     print(f"Errors/skipped: {error_count:,}")
     
-    if not records:
+    if valid_count == 0:
         print("No valid records found!")
+        output_file.unlink(missing_ok=True)
         return False
     
-    # Convert to DataFrame
-    print("Converting to DataFrame...")
-    df = pd.DataFrame(records)
-    
-    # Filter for years 1999-2020
-    print(f"Filtering data to years 1999-2020...")
-    df = df[(df['Year'] >= 1999) & (df['Year'] <= 2020)]
-    print(f"Filtered data contains {len(df):,} records.")
+    print(f"Filtered data to years 1999-2020: {filtered_count:,} records.")
     
     # Data quality checks
     print(f"\nData quality summary:")
-    print(f"Years covered: {df['Year'].min()} - {df['Year'].max()}")
-    print(f"Unique counties: {df['COUNTY_FIPS'].nunique():,}")
-    print(f"Race codes: {np.sort(df['Race'].unique())}")
-    print(f"Origin codes: {np.sort(df['Origin'].unique())}")
-    print(f"Sex codes: {np.sort(df['Sex'].unique())}")
-    print(f"Age codes: {np.sort(df['Age'].unique())}")
-    print(f"Total population (1999-2020): {df['Population'].sum():,}")
-    
-    # Ensure output directory exists
-    output_file.parent.mkdir(parents=True, exist_ok=True)
+    if filtered_count:
+        print(f"Years covered: {codes['Year'].min()} - {codes['Year'].max()}")
+    print(f"Unique counties: {len(counties):,}")
+    print(f"Race codes: {codes['Race']}")
+    print(f"Origin codes: {codes['Origin']}")
+    print(f"Sex codes: {codes['Sex']}")
+    print(f"Age codes: {codes['Age']}")
+    print(f"Total population (1999-2020): {population_total:,}")
     
-    # Save to CSV
-    print(f"\nSaving to {output_file}...")
-    df.to_csv(output_file, index=False)
+    print(f"\nSaved to {output_file}")
     print("File saved successfully!")
     
     return True
@@ -184,7 +383,8 @@ def main():
         
         # Define output file path using config
         processed_dir = config['data_directories']['processed']
-        output_file = project_root / processed_dir / "Socioeconomic/Population_Structure.csv"
+        output_suffix = '.csv' if OUTPUT_FORMAT == 'csv' else '.parquet'
+        output_file = project_root / processed_dir / f"Socioeconomic/Population_Structure{output_suffix}"
         
         # Check if input file exists
         if not input_file.exists():
@@ -7,37 +7,29 @@ USDA ERS 教育数据合并脚本
 - 将长格式数据转换为宽表格式
 """
 
-import sys
-from pathlib import Path
+import re
 import pandas as pd
-import os
-import yaml
+import pyarrow as pa
+from _paths import get_paths
+from _csv_output import write_csv
 
-def load_paths():
-    """从config.yaml加载路径"""
-    project_root = Path(__file__).resolve().parents[2]
-    config_path = project_root / "config.yaml"
-    if not config_path.exists():
-        sys.exit(f"ERROR: Configuration file not found: {config_path}")
-
-    with config_path.open("r", encoding="utf-8") as f:
-        cfg = yaml.safe_load(f)
-
-    try:
-        usda_config = cfg["data_sources"]["socioeconomic"]["usda_ers"]
-        input_rel = usda_config["original"]
-        output_rel = usda_config["processed"]
-    except (KeyError, TypeError):
-        sys.exit("ERROR: config.yaml is missing the required path for data_sources.socioeconomic.usda_ers")
-
-    input_dir = (project_root / input_rel).resolve()
-    output_dir = (project_root / output_rel).resolve()
-
-    if not input_dir.exists():
-        sys.exit(f"ERROR: Input directory not found: {input_dir}")
-
-    output_dir.mkdir(parents=True, exist_ok=True)
-    return input_dir, output_dir
+# 属性名关键词（小写）-> 目标指标，顺序即输出列顺序
+PERCENT_METRICS = {
+    'Less_Than_High_School_Percent': ['less than', 'not high school'],
+    'High_School_Only_Percent': ['high school diploma only', 'high school graduates (or equivalent)'],
+    'Some_College_Percent': ['some college', 'associate degree'],
+    'College_Plus_Percent': ['four years of college', "bachelor's degree", 'college or higher'],
+}
+CODE_METRICS = {
+    'Rural_Urban_Continuum_Code': ['rural-urban continuum code'],
+    'Urban_Influence_Code': ['urban influence code'],
+}
+ATTRIBUTE_KEYWORDS = {
+    keyword: metric
+    for metric, keywords in {**PERCENT_METRICS, **CODE_METRICS}.items()
+    for keyword in keywords
+}
+ATTRIBUTE_PATTERN = re.compile('(' + '|'.join(map(re.escape, ATTRIBUTE_KEYWORDS)) + ')')
 
 def merge_education_data(input_dir, output_dir):
     """合并教育数据"""
@@ -77,63 +69,40 @@ def merge_education_data(input_dir, output_dir):
     # 标准化FIPS代码
     df_county['COUNTY_FIPS'] = df_county['FIPS Code'].astype(str).str.zfill(5)
     
-    # 提取年份
-    def extract_year(attribute):
-        if ', ' in attribute:
-            year_part = attribute.split(', ')[-1]
-            if year_part.isdigit():
-                return int(year_part)
-            elif year_part == '2008-12':
-                return 2010
-            elif year_part == '2019-23':
-                return 2021
-        return None
-    
-    df_county['Year'] = df_county['Attribute'].apply(extract_year)
+    # 提取年份（属性名最后一个", "之后的部分；多年区间取代表年份）
+    year_part = df_county['Attribute'].str.rsplit(', ', n=1).str[1]
+    year_part = year_part.replace({'2008-12': '2010', '2019-23': '2021'})
+    df_county['Year'] = pd.to_numeric(year_part.where(year_part.str.isdigit()), errors='coerce').astype('Int32')
     
     # 过滤1999-2020年的数据
     df_filtered = df_county[df_county['Year'].between(1999, 2020)].copy()
+    
+    # FIPS转为分类类型，后续透视、合并与分组都基于整数编码
+    df_filtered['COUNTY_FIPS'] = df_filtered['COUNTY_FIPS'].astype('category')
     print(f"1999-2020年数据形状: {df_filtered.shape}")
     
-    # 创建结果数据框
-    result_data = []
-    
-    # 按县和年份分组处理
-    for (fips, year), group in df_filtered.groupby(['COUNTY_FIPS', 'Year']):
-        row_data = {'COUNTY_FIPS': fips, 'Year': year}
-        
-        # 提取教育水平数据
-        for _, row in group.iterrows():
-            attr = row['Attribute']
-            value = row['Value']
-            
-            if 'percent' in attr.lower() or 'Percent' in attr:
-                # 高中以下学历
-                if any(keyword in attr.lower() for keyword in ['less than', 'not high school']):
-                    row_data['Less_Than_High_School_Percent'] = value
-                # 仅高中学历
-                elif any(keyword in attr.lower() for keyword in ['high school diploma only', 'high school graduates (or equivalent)']):
-                    row_data['High_School_Only_Percent'] = value
-                # 部分大学学历
-                elif any(keyword in attr.lower() for keyword in ['some college', 'associate degree']):
-                    row_data['Some_College_Percent'] = value
-                # 大学及以上学历
-                elif any(keyword in attr.lower() for keyword in ['four years of college', "bachelor's degree", 'college or higher']):
-                    row_data['College_Plus_Percent'] = value
-        
-        # 提取城乡分类代码
-        rural_urban_rows = group[group['Attribute'].str.contains('Rural-urban Continuum Code', na=False)]
-        if not rural_urban_rows.empty:
-            row_data['Rural_Urban_Continuum_Code'] = rural_urban_rows.iloc[0]['Value']
-        
-        urban_influence_rows = group[group['Attribute'].str.contains('Urban Influence Code', na=False)]
-        if not urban_influence_rows.empty:
-            row_data['Urban_Influence_Code'] = urban_influence_rows.iloc[0]['Value']
-        
-        result_data.append(row_data)
-    
-    # 转换为DataFrame
-    result_df = pd.DataFrame(result_data)
+    # 按属性名将每行归类到目标指标：预编译的关键词正则对小写属性名只扫描一遍
+    attr_lower = df_filtered['Attribute'].str.lower()
+    metric = attr_lower.str.extract(ATTRIBUTE_PATTERN, expand=False).map(ATTRIBUTE_KEYWORDS)
+    # 百分比指标只接受含"percent"的属性
+    is_percent = attr_lower.str.contains('percent', regex=False, na=False)
+    df_filtered['Metric'] = metric.where(is_percent | metric.isin(CODE_METRICS)).fillna('')
+    
+    # 同一县-年份内：百分比取最后一条，城乡分类代码取第一条
+    key_cols = ['COUNTY_FIPS', 'Year']
+    is_code = df_filtered['Metric'].isin(CODE_METRICS)
+    pieces = [
+        df_filtered[(df_filtered['Metric'] != '') & ~is_code].drop_duplicates(key_cols + ['Metric'], keep='last'),
+        df_filtered[is_code].drop_duplicates(key_cols + ['Metric'], keep='first'),
+    ]
+    long_df = pd.concat(pieces, ignore_index=True)
+    
+    # 转换为宽表：每个县-年份一行（包括没有匹配到任何指标的县-年份）
+    wide = long_df.pivot(index=key_cols, columns='Metric', values='Value')
+    all_keys = pd.MultiIndex.from_frame(df_filtered[key_cols].drop_duplicates().sort_values(key_cols))
+    columns = [col for col in [*PERCENT_METRICS, *CODE_METRICS] if col in wide.columns]
+    result_df = wide.reindex(index=all_keys, columns=columns).reset_index()
+    result_df.columns.name = None
     
     print(f"处理后的数据形状: {result_df.shape}")
     
@@ -147,6 +116,7 @@ def merge_education_data(input_dir, output_dir):
     # 创建完整的县-年份组合
     complete_index = pd.MultiIndex.from_product([all_counties, all_years], names=['COUNTY_FIPS', 'Year'])
     complete_df = pd.DataFrame(index=complete_index).reset_index()
+    complete_df['COUNTY_FIPS'] = complete_df['COUNTY_FIPS'].astype(result_df['COUNTY_FIPS'].dtype)
     
     # 合并现有数据
     result_df = complete_df.merge(result_df, on=['COUNTY_FIPS', 'Year'], how='left')
@@ -159,30 +129,17 @@ def merge_education_data(input_dir, output_dir):
         'College_Plus_Percent'
     ]
     
-    # 对每个县进行线性插值
-    interpolated_data = []
-    for county_fips in all_counties:
-        county_data = result_df[result_df['COUNTY_FIPS'] == county_fips].copy()
-        county_data = county_data.sort_values('Year')
-        
-        # 对数值列进行线性插值
-        for col in numeric_columns:
-            county_data[col] = county_data[col].interpolate(method='linear', limit_direction='both')
-        
-        # 对分类变量使用前向填充，如果列存在
-        if 'Rural_Urban_Continuum_Code' in county_data.columns:
-            county_data['Rural_Urban_Continuum_Code'] = county_data['Rural_Urban_Continuum_Code'].fillna(method='ffill').fillna(method='bfill')
-        
-        if 'Urban_Influence_Code' in county_data.columns:
-            county_data['Urban_Influence_Code'] = county_data['Urban_Influence_Code'].fillna(method='ffill').fillna(method='bfill')
-        
-        interpolated_data.append(county_data)
-    
-    # 合并所有县的数据
-    result_df = pd.concat(interpolated_data, ignore_index=True)
-    
-    # 排序
-    result_df = result_df.sort_values(['COUNTY_FIPS', 'Year'])
+    # 按县分组进行线性插值（先排序，保证组内按年份有序）
+    result_df = result_df.sort_values(['COUNTY_FIPS', 'Year'], ignore_index=True)
+    result_df[numeric_columns] = result_df.groupby('COUNTY_FIPS', sort=False, observed=True)[numeric_columns].transform(
+        lambda s: s.interpolate(method='linear', limit_direction='both')
+    )
+    
+    # 对分类变量使用组内前向填充再后向填充，如果列存在
+    for col in ['Rural_Urban_Continuum_Code', 'Urban_Influence_Code']:
+        if col in result_df.columns:
+            result_df[col] = result_df.groupby('COUNTY_FIPS', sort=False, observed=True)[col].ffill()
+            result_df[col] = result_df.groupby('COUNTY_FIPS', sort=False, observed=True)[col].bfill()
     
     print(f"插值完成，总共 {len(result_df)} 行")
     print(f"覆盖年份: 1999-2020")
@@ -195,7 +152,7 @@ def merge_education_data(input_dir, output_dir):
 
     # 保存合并后的数据
     output_file = output_dir / "Education.csv"
-    result_df.to_csv(output_file, index=False)
+    write_csv(pa.Table.from_pandas(result_df, preserve_index=False), output_file)
     print(f"数据已保存到: {output_file}")
     
     return result_df
@@ -203,7 +160,7 @@ def merge_education_data(input_dir, output_dir):
 def main():
     """主函数"""
     # 加载路径
-    input_dir, output_dir = load_paths()
+    input_dir, output_dir = get_paths('socioeconomic', 'usda_ers')
     
     # 合并数据
     merged_data = merge_education_data(input_dir, output_dir)
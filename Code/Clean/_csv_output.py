@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Clean 脚本共用的 PyArrow CSV 写出
+- 表头与字符串的引号规则与 DataFrame.to_csv 一致：只有包含分隔符、引号或换行的值才加引号
+  （PyArrow 的 quoting_style='needed' 会给所有字符串加引号，所以表头自行写出，数据用 'none' 写出）
+- 与 to_csv 的差异：浮点数按 Arrow 的最短表示写出，整数值的浮点数写作 1 而非 1.0，
+  很大或很小的数可能写成科学计数法（如 1e+15）；读回后数值不变
+"""
+
+import csv
+import io
+import pyarrow as pa
+import pyarrow.csv as pv
+
+UNQUOTED = pv.WriteOptions(include_header=False, quoting_style='none')
+QUOTED = pv.WriteOptions(include_header=False, quoting_style='needed')
+
+def header_line(names):
+    """按 csv 模块的最少引号规则生成表头行"""
+    buf = io.StringIO()
+    csv.writer(buf, lineterminator='\n').writerow(names)
+    return buf.getvalue().encode('utf-8')
+
+def write_csv(table, output_file):
+    """把 Arrow 表写成 CSV；有值包含分隔符、引号或换行时改为给全部字符串加引号"""
+    with open(output_file, 'wb') as f:
+        f.write(header_line(table.column_names))
+        start = f.tell()
+        try:
+            pv.write_csv(table, f, write_options=UNQUOTED)
+        except pa.ArrowInvalid:
+            f.seek(start)
+            f.truncate()
+            pv.write_csv(table, f, write_options=QUOTED)
+
+def open_csv_writer(output_file, schema):
+    """打开逐块写出的 CSVWriter（先写表头）；只适用于字符串列不含分隔符、引号或换行的表"""
+    sink = pa.OSFile(str(output_file), 'wb')
+    sink.write(header_line(schema.names))
+    return _ClosingCSVWriter(sink, schema)
+
+class _ClosingCSVWriter(pv.CSVWriter):
+    """关闭时同时关闭底层文件的 CSVWriter"""
+
+    def __init__(self, sink, schema):
+        super().__init__(sink, schema, write_options=UNQUOTED)
+        self._sink = sink
+
+    def close(self):
+        super().close()
+        self._sink.close()
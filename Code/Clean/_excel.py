@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Clean 脚本共用的 Excel 读取
+- read_excel 优先使用 python-calamine 引擎，未安装或格式不支持时回退到 pandas 默认引擎
+- read_excel_typed 在读取时按 dtype 转换数值列，含非数值单元格时回退为 to_numeric 强制转换
+"""
+
+import pandas as pd
+
+# 可选：python-calamine（Rust实现的Excel解析器，比openpyxl/xlrd快得多）
+try:
+    import python_calamine  # type: ignore
+except Exception:
+    python_calamine = None
+
+def read_excel(file_path, **kwargs):
+    """优先用calamine引擎读取Excel，未安装或格式不支持时回退到pandas默认引擎"""
+    if python_calamine is not None:
+        try:
+            return pd.read_excel(file_path, engine='calamine', **kwargs)
+        except Exception as e:
+            print(f"    - calamine读取失败，回退到默认引擎: {e}")
+    return pd.read_excel(file_path, **kwargs)
+
+def read_excel_typed(file_path, dtype, **kwargs):
+    """读取Excel时直接按dtype转换数值列；含非数值单元格或整数列含小数时，回退为读取后用 to_numeric 强制转换
+
+    整数列（如 Int64）先四舍五入再转换，避免单个非整数单元格让整个文件读取失败。
+    """
+    try:
+        return read_excel(file_path, dtype=dtype, **kwargs)
+    except (ValueError, TypeError):
+        df = read_excel(file_path, **kwargs)
+        for col, col_dtype in dtype.items():
+            if col in df.columns:
+                values = pd.to_numeric(df[col], errors='coerce')
+                if pd.api.types.is_integer_dtype(col_dtype):
+                    values = values.round()
+                df[col] = values.astype(col_dtype)
+        return df
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Clean 脚本共用的配置与路径解析
+- config.yaml 在同一进程内只解析一次（多个脚本串联运行时共享）
+- get_paths(section, subsection) 返回 data_sources.<section>.<subsection>.original/processed 对应的目录
+"""
+
+import sys
+from functools import lru_cache
+from pathlib import Path
+import yaml
+
+# 脚本位于 WDP/Code/Clean，项目根目录在上两级
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+
+# PyYAML 编译了 libyaml 时使用 C 实现的加载器，否则退回纯 Python 实现
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+@lru_cache(maxsize=1)
+def load_config():
+    """读取并缓存 config.yaml"""
+    config_path = PROJECT_ROOT / "config.yaml"
+    if not config_path.exists():
+        sys.exit(f"ERROR: Configuration file not found: {config_path}")
+
+    with config_path.open("r", encoding="utf-8") as f:
+        return yaml.load(f, Loader=SafeLoader)
+
+@lru_cache(maxsize=None)
+def get_paths(section, subsection):
+    """从config.yaml加载输入/输出路径，并确保输出目录存在"""
+    cfg = load_config()
+
+    try:
+        source_config = cfg["data_sources"][section][subsection]
+        input_rel = source_config["original"]
+        output_rel = source_config["processed"]
+    except (KeyError, TypeError):
+        sys.exit(f"ERROR: config.yaml is missing the required path for data_sources.{section}.{subsection}")
+
+    input_dir = (PROJECT_ROOT / input_rel).resolve()
+    output_dir = (PROJECT_ROOT / output_rel).resolve()
+
+    if not input_dir.exists():
+        sys.exit(f"ERROR: Input directory not found: {input_dir}")
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    return input_dir, output_dir
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+社会经济数据清洗流水线
+- 在同一个解释器中依次运行各 SE_* 脚本的 main()，pandas/pyarrow 只导入一次，config.yaml 只解析一次
+- 用法：python Code/Clean/run_all.py [stage ...] [--force]，不指定 stage 时运行全部
+"""
+
+import argparse
+import importlib
+import time
+
+# 阶段名 -> 模块名（按运行顺序）
+STAGES = {
+    'laus': 'SE_LAUS_Merge',
+    'saipe': 'SE_SAIPE_Merge',
+    'bea': 'SE_BEA_Merge',
+    'education': 'SE_USDA_ERS_Education_Merge',
+    'seer': 'SE_SEER_Population',
+}
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="依次运行社会经济数据清洗脚本")
+    parser.add_argument("stages", nargs="*", metavar="stage",
+                        help=f"要运行的阶段（{', '.join(STAGES)}），默认全部")
+    parser.add_argument("--force", action="store_true", help="传给 SAIPE：忽略Excel解析缓存")
+    args = parser.parse_args()
+    unknown = [stage for stage in args.stages if stage not in STAGES]
+    if unknown:
+        parser.error(f"未知阶段: {', '.join(unknown)}")
+    return args
+
+def main():
+    """主函数"""
+    args = parse_args()
+    stages = args.stages or list(STAGES)
+
+    for stage in stages:
+        module_name = STAGES[stage]
+        print(f"\n===== {stage}: {module_name} =====")
+        start = time.time()
+        module = importlib.import_module(module_name)
+        if stage == 'saipe':
+            module.main(['--force'] if args.force else [])
+        else:
+            module.main()
+        print(f"===== {stage} 完成，用时 {time.time() - start:.1f} 秒 =====")
+
+if __name__ == "__main__":
+    main()
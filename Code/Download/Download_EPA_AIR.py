@@ -1,19 +1,52 @@
 from __future__ import annotations
 
 import argparse
+import io
+import json
+import os
 import shutil
 import subprocess
 import sys
+import tempfile
+import threading
 import time
 import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from urllib import request, error
+
+import requests
+
+# 可选：rarfile 在进程内读取 RAR 结构并自动选用可用的解压后端（unrar/unar/bsdtar/7z）
+try:
+    import rarfile  # type: ignore
+except Exception:
+    rarfile = None
+
+# 可选：pyarrow 用于 --format parquet，把解压出的 CSV 流式转为 zstd 压缩的 Parquet
+try:
+    import pyarrow as pa  # type: ignore
+    import pyarrow.csv as pv  # type: ignore
+    import pyarrow.parquet as pq  # type: ignore
+except Exception:
+    pa = pv = pq = None
 
 # 导入配置文件
 import sys
 from pathlib import Path
 sys.path.append(str(Path(__file__).parent.parent))
 from config import get_data_dir, ensure_dir
+from _http import (
+    CHUNK_SIZE,
+    SESSION,
+    advise_sequential,
+    conditional_headers,
+    get_with_resume,
+    log,
+    read_validators,
+    response_validators,
+    validators_match,
+    write_validators,
+)
 
 # python3 Download_EPA_Air.py --start 1999 --end 2024 --filename daily_42401
 
@@ -24,6 +57,34 @@ FILE_NAME_PART = "daily_42602"
 # 基础URL前缀
 BASE_PREFIX = "https://aqs.epa.gov/aqsweb/airdata"
 
+# 远端可能提供的格式（按优先级）
+REMOTE_EXTS = (".zip", ".rar", ".csv")
+
+# 远端格式缓存文件（basename -> 扩展名），重复运行时跳过 HEAD 探测
+EXT_CACHE_NAME = ".ext_cache.json"
+
+# 已知打包了多个文件的 ZIP（basename 列表）：只有这些压缩包在重新下载时按需读取所需的 CSV 成员，
+# 单成员的 ZIP（AQS 的常规情况）直接分段下载，不为读取目录多发请求
+MULTI_MEMBER_CACHE_NAME = ".multi_member_zips.json"
+
+# 探测失败缓存文件（basename -> {扩展名: 404 时间戳}），PROBE_CACHE_TTL 秒内不再对同一格式发 HEAD
+PROBE_CACHE_NAME = ".probe_cache.json"
+PROBE_CACHE_TTL = 30 * 24 * 3600
+
+# 转为 Parquet 时按字符串读取的列：代码带前导零（如 State Code "06"），且可能出现非数字值（加拿大站点为 "CC"）
+PARQUET_STRING_COLUMNS = ("State Code", "County Code", "Site Num", "Parameter Code", "Method Code")
+
+# 并行下载的默认线程数
+DEFAULT_WORKERS = 8
+
+# 服务器支持 Range 且大于该大小的压缩包，分成 MULTIPART_PARTS 段并行下载
+MULTIPART_MIN_SIZE = 8 * 1024 * 1024
+MULTIPART_PARTS = 4
+
+# 格式缓存与探测缓存文件在多线程下读写，需要加锁
+_ext_cache_lock = threading.Lock()
+_probe_cache_lock = threading.Lock()
+
 
 def get_effective_file_part(arg_filename: str | None) -> str:
     return (arg_filename or FILE_NAME_PART).strip()
@@ -35,30 +96,304 @@ def ensure_destination_dir(file_part: str) -> Path:
     return ensure_dir(dest_dir)
 
 
-def download_file(url: str, dest_path: Path, retries: int = 3, backoff_seconds: float = 2.0) -> None:
-    last_exc: Exception | None = None
+def drop_page_cache(path: Path) -> None:
+    # 下载/解压完成的 CSV 由后续清洗步骤另行读取，提示内核释放其页缓存，把内存留给并行下载的其它年份
+    if not hasattr(os, "posix_fadvise"):
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    finally:
+        os.close(fd)
+
+
+def download_file(url: str, dest_path: Path, retries: int = 3, backoff_seconds: float = 2.0) -> dict[str, str | None]:
+    # 返回远端的 ETag/Last-Modified，供 write_validators 记录；404 原样抛出，由 download_year 清除格式缓存
+    return get_with_resume(url, dest_path, retries=retries, backoff_seconds=backoff_seconds)
+
+
+def _fetch_range(url: str, tmp_path: Path, start: int, end: int, etag: str | None) -> None:
+    # 下载 [start, end] 字节段并写入预分配文件的对应位置（每个线程使用独立的文件句柄）
+    headers = {"Range": f"bytes={start}-{end}", "Accept-Encoding": "identity"}
+    if etag:
+        headers["If-Range"] = etag
+    written = 0
+    with SESSION.get(url, stream=True, timeout=30, headers=headers) as resp:
+        resp.raise_for_status()
+        if resp.status_code != 206:
+            raise requests.ConnectionError(f"服务器未按范围返回 (HTTP {resp.status_code}): {url}", response=resp)
+        with tmp_path.open("r+b", buffering=CHUNK_SIZE) as out:
+            out.seek(start)
+            for chunk in resp.iter_content(chunk_size=CHUNK_SIZE):
+                out.write(chunk)
+                written += len(chunk)
+    if written != end - start + 1:
+        raise requests.ConnectionError(f"分段下载不完整: bytes {start}-{end}: {url}")
+
+
+def ranged_download(url: str, dest_path: Path, parts: int = MULTIPART_PARTS) -> dict[str, str | None]:
+    # 大文件按字节范围分段、多连接并行下载；不支持 Range、文件较小或已有可续传片段时走单连接 download_file
+    tmp_path = dest_path.with_suffix(dest_path.suffix + ".part")
+    head = SESSION.head(url, allow_redirects=True, timeout=30, headers={"Accept-Encoding": "identity"})
+    head.raise_for_status()
+    size = int(head.headers.get("Content-Length") or 0)
+    if (
+        parts < 2
+        or size < MULTIPART_MIN_SIZE
+        or head.headers.get("Accept-Ranges", "").lower() != "bytes"
+        or (tmp_path.exists() and tmp_path.stat().st_size > 0)
+    ):
+        return download_file(url, dest_path)
+
+    with tmp_path.open("wb") as out:
+        out.truncate(size)
+    step = -(-size // parts)
+    bounds = [(start, min(start + step, size) - 1) for start in range(0, size, step)]
+    etag = head.headers.get("ETag")
+    try:
+        with ThreadPoolExecutor(max_workers=len(bounds)) as executor:
+            futures = [executor.submit(_fetch_range, url, tmp_path, start, end, etag) for start, end in bounds]
+            for future in futures:
+                future.result()
+    except requests.RequestException as exc:
+        # 预分配的文件含空洞，不能用于续传，删除后改为单连接下载
+        log(f"[WARN] {dest_path.name} 分段下载失败，改为单连接下载: {exc}")
+        tmp_path.unlink(missing_ok=True)
+        return download_file(url, dest_path)
+    tmp_path.replace(dest_path)
+    return {"etag": etag, "last_modified": head.headers.get("Last-Modified")}
+
+
+def extract_zip_from_url(url: str, dest_dir: Path, retries: int = 3, backoff_seconds: float = 2.0) -> dict[str, str | None]:
+    # 把 ZIP 下载到内存缓冲区（超过 MULTIPART_MIN_SIZE 时自动转存临时文件）后直接解压
     for attempt in range(1, retries + 1):
         try:
-            # 使用临时文件，成功后原子替换，避免中断产生损坏文件
-            tmp_path = dest_path.with_suffix(dest_path.suffix + ".part")
-            with request.urlopen(url) as resp, tmp_path.open("wb") as out:
-                # 流式写入，避免大文件占用内存
-                chunk_size = 1024 * 256
-                while True:
-                    chunk = resp.read(chunk_size)
-                    if not chunk:
-                        break
-                    out.write(chunk)
-            tmp_path.replace(dest_path)
-            return
-        except (error.HTTPError, error.URLError) as exc:
-            last_exc = exc
+            with tempfile.SpooledTemporaryFile(max_size=MULTIPART_MIN_SIZE) as buf:
+                with SESSION.get(url, stream=True, timeout=30, headers={"Accept-Encoding": "identity"}) as resp:
+                    resp.raise_for_status()
+                    length = resp.headers.get("Content-Length")
+                    validators = response_validators(resp.headers)
+                    for chunk in resp.iter_content(chunk_size=CHUNK_SIZE):
+                        buf.write(chunk)
+                if length is not None and buf.tell() != int(length):
+                    raise requests.ConnectionError(f"下载不完整: {buf.tell()} / {length} 字节: {url}")
+                buf.seek(0)
+                with zipfile.ZipFile(buf) as zip_ref:
+                    zip_ref.extractall(dest_dir)
+            return validators
+        except requests.RequestException as exc:
+            # 404 交给 download_year 处理，不必重试
+            response = getattr(exc, "response", None)
+            if response is not None and response.status_code == 404:
+                raise
             if attempt < retries:
                 time.sleep(backoff_seconds * attempt)
             else:
                 raise
 
 
+class HttpRangeFile(io.RawIOBase):
+    # 只读、可 seek 的远端文件，供 zipfile 直接读取：顺序读取复用同一个流式 Range 响应，
+    # 位置跳转时才重新发起 GET；If-Range 保证各次请求读到的是同一版本的文件
+    def __init__(self, url: str) -> None:
+        super().__init__()
+        head = SESSION.head(url, allow_redirects=True, timeout=30, headers={"Accept-Encoding": "identity"})
+        head.raise_for_status()
+        if head.headers.get("Accept-Ranges", "").lower() != "bytes" or "Content-Length" not in head.headers:
+            raise requests.ConnectionError(f"服务器不支持 Range 请求: {url}")
+        self.url = url
+        self.size = int(head.headers["Content-Length"])
+        self.validators = response_validators(head.headers)
+        self._pos = 0
+        self._resp: requests.Response | None = None
+        self._resp_pos = -1
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += self.size
+        self._pos = max(0, offset)
+        return self._pos
+
+    def readinto(self, buffer) -> int:
+        if self._pos >= self.size:
+            return 0
+        if self._resp is None or self._resp_pos != self._pos:
+            self._close_response()
+            headers = {"Range": f"bytes={self._pos}-", "Accept-Encoding": "identity"}
+            if self.validators["etag"]:
+                headers["If-Range"] = self.validators["etag"]
+            resp = SESSION.get(self.url, stream=True, timeout=30, headers=headers)
+            resp.raise_for_status()
+            if resp.status_code != 206:
+                resp.close()
+                raise requests.ConnectionError(f"服务器未按范围返回 (HTTP {resp.status_code}): {self.url}")
+            self._resp = resp
+            self._resp_pos = self._pos
+        data = self._resp.raw.read(len(buffer))
+        if not data:
+            raise requests.ConnectionError(f"连接提前断开: {self.url}")
+        buffer[:len(data)] = data
+        self._pos += len(data)
+        self._resp_pos = self._pos
+        return len(data)
+
+    def _close_response(self) -> None:
+        if self._resp is not None:
+            self._resp.close()
+            self._resp = None
+
+    def close(self) -> None:
+        self._close_response()
+        super().close()
+
+
+def remote_zip_member_extract(url: str, dest_dir: Path, member_name: str) -> dict[str, str | None] | None:
+    # 只下载 ZIP 末尾的目录（EOCD/ZIP64 记录与中央目录，由 zipfile 解析）和所需成员的压缩数据，边下载边解压；
+    # 压缩包只有这一个成员时按需读取没有收益，返回 None，交给分段下载
+    dest_path = dest_dir / member_name
+    tmp_path = dest_path.with_suffix(dest_path.suffix + ".part")
+    with HttpRangeFile(url) as raw, io.BufferedReader(raw, buffer_size=CHUNK_SIZE) as fp, zipfile.ZipFile(fp) as zip_ref:
+        info = zip_ref.getinfo(member_name)
+        if len(zip_ref.infolist()) == 1:
+            return None
+        log(f"[EXT] {member_name} 按需下载 {info.compress_size / (1024 * 1024):.2f} / {raw.size / (1024 * 1024):.2f} MB")
+        try:
+            # ZipExtFile 读完时校验 CRC，损坏的数据会抛出 BadZipFile
+            with zip_ref.open(info) as src, tmp_path.open("wb", buffering=CHUNK_SIZE) as out:
+                advise_sequential(out)
+                shutil.copyfileobj(src, out, CHUNK_SIZE)
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+        tmp_path.replace(dest_path)
+        return raw.validators
+
+
+def read_ext_cache(dest_dir: Path) -> dict[str, str]:
+    try:
+        return json.loads((dest_dir / EXT_CACHE_NAME).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def update_ext_cache(dest_dir: Path, basename: str, ext: str | None) -> None:
+    # ext 为 None 时删除该条目；先写临时文件再替换，避免中断产生损坏的缓存
+    with _ext_cache_lock:
+        cache = read_ext_cache(dest_dir)
+        if ext is None:
+            cache.pop(basename, None)
+        else:
+            cache[basename] = ext
+        cache_path = dest_dir / EXT_CACHE_NAME
+        tmp_path = cache_path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(cache, indent=2, sort_keys=True), encoding="utf-8")
+        tmp_path.replace(cache_path)
+
+
+def read_multi_member_zips(dest_dir: Path) -> set[str]:
+    try:
+        return set(json.loads((dest_dir / MULTI_MEMBER_CACHE_NAME).read_text(encoding="utf-8")))
+    except (OSError, ValueError):
+        return set()
+
+
+def record_multi_member_zip(dest_dir: Path, basename: str) -> None:
+    # 先写临时文件再替换，避免中断产生损坏的缓存
+    with _ext_cache_lock:
+        names = read_multi_member_zips(dest_dir)
+        if basename in names:
+            return
+        names.add(basename)
+        cache_path = dest_dir / MULTI_MEMBER_CACHE_NAME
+        tmp_path = cache_path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(sorted(names), indent=2), encoding="utf-8")
+        tmp_path.replace(cache_path)
+
+
+def read_probe_cache(dest_dir: Path) -> dict[str, dict[str, float]]:
+    try:
+        return json.loads((dest_dir / PROBE_CACHE_NAME).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def record_probe_misses(dest_dir: Path, basename: str, exts: list[str]) -> None:
+    # 记录返回 404 的格式及时间，并清理过期条目；先写临时文件再替换，避免中断产生损坏的缓存
+    now = time.time()
+    with _probe_cache_lock:
+        cache = read_probe_cache(dest_dir)
+        cache.setdefault(basename, {}).update({ext: now for ext in exts})
+        cache = {
+            name: {ext: ts for ext, ts in misses.items() if now - ts < PROBE_CACHE_TTL}
+            for name, misses in cache.items()
+        }
+        cache = {name: misses for name, misses in cache.items() if misses}
+        cache_path = dest_dir / PROBE_CACHE_NAME
+        tmp_path = cache_path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(cache, indent=2, sort_keys=True), encoding="utf-8")
+        tmp_path.replace(cache_path)
+
+
+def revalidate(info: dict) -> bool | None:
+    # 带 If-None-Match/If-Modified-Since 的 HEAD 请求，返回远端是否未变化：304 为 True；
+    # 200 时比较响应的 ETag/Last-Modified（服务器可能忽略条件请求头）；请求失败或其它状态返回 None
+    headers = {"Accept-Encoding": "identity", **conditional_headers(info)}
+    try:
+        resp = SESSION.head(info["url"], allow_redirects=True, timeout=30, headers=headers)
+    except requests.RequestException:
+        return None
+    if resp.status_code == 304:
+        return True
+    if resp.status_code == 200:
+        return validators_match(info, resp.headers)
+    return None
+
+
+def remote_size(url: str) -> int | None:
+    # HEAD 请求获取远端文件大小；文件不存在、未提供 Content-Length 或请求失败时返回 None
+    try:
+        resp = SESSION.head(url, allow_redirects=True, timeout=30, headers={"Accept-Encoding": "identity"})
+    except requests.RequestException:
+        return None
+    length = resp.headers.get("Content-Length")
+    if not resp.ok or length is None:
+        return None
+    return int(length)
+
+
+def probe_ext(basename: str, dest_dir: Path) -> str | None:
+    # 依次用 HEAD 请求探测远端存在的格式（只返回响应头，不传输 404 页面），都不存在时返回 None；
+    # PROBE_CACHE_TTL 内已确认 404 的格式直接跳过，新的 404 写入探测缓存
+    now = time.time()
+    recent_misses = read_probe_cache(dest_dir).get(basename, {})
+    misses = []
+    found = None
+    for ext in REMOTE_EXTS:
+        if now - recent_misses.get(ext, 0) < PROBE_CACHE_TTL:
+            continue
+        resp = SESSION.head(f"{BASE_PREFIX}/{basename}{ext}", allow_redirects=True, timeout=30)
+        if resp.ok:
+            found = ext
+            break
+        if resp.status_code != 404:
+            resp.raise_for_status()
+        misses.append(ext)
+    if misses:
+        record_probe_misses(dest_dir, basename, misses)
+    return found
+
+
 def extract_archive(archive_path: Path, dest_dir: Path) -> None:
     suffix = archive_path.suffix.lower()
     if suffix == ".zip":
@@ -66,6 +401,13 @@ def extract_archive(archive_path: Path, dest_dir: Path) -> None:
             zip_ref.extractall(dest_dir)
         return
     if suffix == ".rar":
+        if rarfile is not None:
+            try:
+                with rarfile.RarFile(archive_path) as rar_ref:
+                    rar_ref.extractall(dest_dir)
+                return
+            except rarfile.Error as exc:
+                log(f"[WARN] rarfile 解压失败，改用外部工具: {exc}")
         # 优先使用 unar，其次 unrar
         unar = shutil.which("unar")
         if unar:
@@ -80,56 +422,157 @@ def extract_archive(archive_path: Path, dest_dir: Path) -> None:
     raise RuntimeError(f"不支持的压缩格式: {suffix}")
 
 
-def download_year(year: int, file_part: str, dest_dir: Path) -> None:
+def convert_to_parquet(csv_path: Path) -> Path:
+    # 按 1 MiB 块流式解析 CSV 并逐批写入 Parquet，内存占用与文件大小无关；成功后删除 CSV
+    parquet_path = csv_path.with_suffix(".parquet")
+    tmp_path = parquet_path.with_suffix(".parquet.part")
+    column_types = {name: pa.string() for name in PARQUET_STRING_COLUMNS}
+    try:
+        reader = pv.open_csv(
+            csv_path,
+            read_options=pv.ReadOptions(block_size=CHUNK_SIZE),
+            convert_options=pv.ConvertOptions(column_types=column_types),
+        )
+        with pq.ParquetWriter(tmp_path, reader.schema, compression="zstd") as writer:
+            for batch in reader:
+                writer.write_batch(batch)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    tmp_path.replace(parquet_path)
+    csv_path.unlink()
+    return parquet_path
+
+
+def finish_csv(
+    year: int,
+    csv_path: Path,
+    output_format: str,
+    url: str | None = None,
+    validators: dict[str, str | None] | None = None,
+) -> None:
+    # CSV 就绪后的收尾：按需转为 Parquet，记录校验信息（如有）并释放页缓存
+    final_path = csv_path
+    if output_format == "parquet":
+        try:
+            final_path = convert_to_parquet(csv_path)
+        except pa.ArrowInvalid as exc:
+            # 后续数据块与首块推断的类型不符等情况：保留 CSV，不影响下载结果
+            log(f"[WARN] {year} 转换 Parquet 失败，保留 CSV: {exc}")
+    if validators is not None:
+        write_validators(final_path, validators, url)
+    drop_page_cache(final_path)
+    size_mb = final_path.stat().st_size / (1024 * 1024)
+    log(f"[DONE] {year} -> {final_path} ({size_mb:.2f} MB)")
+
+
+def download_year(year: int, file_part: str, dest_dir: Path, output_format: str = "csv") -> None:
     # 目标文件名（不含后缀）
     basename = f"{file_part}_{year}"
     csv_path = dest_dir / f"{basename}.csv"
     zip_path = dest_dir / f"{basename}.zip"
     rar_path = dest_dir / f"{basename}.rar"
+    parquet_path = dest_dir / f"{basename}.parquet"
 
-    # 如果CSV已存在则跳过
-    if csv_path.exists() and csv_path.stat().st_size > 0:
-        print(f"[SKIP] {year} CSV已存在: {csv_path}")
+    # 最终文件有上次下载记录的 ETag/Last-Modified 时发条件请求：304 说明远端未变化，直接跳过；
+    # 200 说明远端已重新发布，重新下载覆盖
+    final_path = parquet_path if output_format == "parquet" else csv_path
+    validators = read_validators(final_path)
+    unchanged = revalidate(validators) if validators is not None else None
+    if unchanged:
+        log(f"[SKIP] {year} 远端未更新: {final_path}")
         return
-    # 如果压缩包已存在（且非空），也跳过
-    if zip_path.exists() and zip_path.stat().st_size > 0:
-        print(f"[SKIP] {year} ZIP已存在: {zip_path}")
-        return
-    if rar_path.exists() and rar_path.stat().st_size > 0:
-        print(f"[SKIP] {year} RAR已存在: {rar_path}")
+    if unchanged is False:
+        log(f"[STALE] {year} 远端文件已更新，重新下载")
+    elif output_format == "parquet" and parquet_path.exists():
+        log(f"[SKIP] {year} Parquet已存在: {parquet_path}")
         return
+    else:
+        # 没有校验记录时，用 HEAD 的 Content-Length 核对本地 CSV 或压缩包大小，只有与远端一致才跳过；
+        # 最终文件只由 .part 原子替换得到，大小不一致说明远端已重新发布：删除后完整重新下载
+        # （不能转为 .part 续传，否则新文件的尾部会拼接在旧文件之后）
+        for path, label in ((csv_path, "CSV"), (zip_path, "ZIP"), (rar_path, "RAR")):
+            if not (path.exists() and path.stat().st_size > 0):
+                continue
+            local_size = path.stat().st_size
+            size = remote_size(f"{BASE_PREFIX}/{path.name}")
+            if size is None or size == local_size:
+                # 远端没有同名文件（如 CSV 由压缩包解压得到）时无法按大小核对，视为完整
+                log(f"[SKIP] {year} {label}已存在: {path}")
+                if output_format == "parquet" and path == csv_path:
+                    # 之前以 CSV 格式下载过，只需转换
+                    finish_csv(year, csv_path, output_format)
+                return
+            log(f"[STALE] {year} {label} 大小与远端不一致 ({local_size} / {size} 字节)，重新下载")
+            path.unlink()
+            break
 
-    # 依次尝试 .zip, .rar, .csv
-    for ext in (".zip", ".rar", ".csv"):
-        url = f"{BASE_PREFIX}/{basename}{ext}"
-        out_path = dest_dir / f"{basename}{ext}"
-        print(f"[GET ] {year} <- {url}")
-        try:
-            download_file(url, out_path)
-            size_mb = out_path.stat().st_size / (1024 * 1024)
-            print(f"[SAVE] {year} -> {out_path} ({size_mb:.2f} MB)")
-
-            # 如果是压缩包则解压并删除
-            if ext in (".zip", ".rar"):
-                print(f"[EXT] {year} 解压缩中...")
-                extract_archive(out_path, dest_dir)
+    # 确定远端格式：优先使用缓存，否则 HEAD 探测，然后只发起一次 GET
+    ext = read_ext_cache(dest_dir).get(basename)
+    if ext is None:
+        ext = probe_ext(basename, dest_dir)
+        if ext is None:
+            log(f"[FAIL] {year} 未找到可用的下载格式 ({'/'.join(REMOTE_EXTS)})")
+            return
+        update_ext_cache(dest_dir, basename, ext)
+
+    url = f"{BASE_PREFIX}/{basename}{ext}"
+    out_path = dest_dir / f"{basename}{ext}"
+    log(f"[GET ] {year} <- {url}")
+    try:
+        # 小于分段下载阈值的 ZIP 在内存中下载并直接解压，不再写出、读回、删除压缩包；
+        # 较大的压缩包或存在待续传片段时仍走落盘路径
+        if ext == ".zip" and not out_path.with_suffix(".zip.part").exists():
+            size = remote_size(url)
+            if size is not None and size < MULTIPART_MIN_SIZE:
+                log(f"[EXT] {year} 下载并在内存中解压 ({size / (1024 * 1024):.2f} MB)")
+                validators = extract_zip_from_url(url, dest_dir)
                 if csv_path.exists():
-                    csv_size_mb = csv_path.stat().st_size / (1024 * 1024)
-                    print(f"[DONE] {year} -> {csv_path} ({csv_size_mb:.2f} MB)")
-                out_path.unlink(missing_ok=True)
-                print(f"[DEL ] {year} 已删除压缩文件")
+                    finish_csv(year, csv_path, output_format, url, validators)
+                return
+            # 之前下载时确认打包了多个文件的 ZIP，只取所需的 CSV 成员；失败时退回下载整个压缩包
+            if size is not None and basename in read_multi_member_zips(dest_dir):
+                try:
+                    validators = remote_zip_member_extract(url, dest_dir, csv_path.name)
+                except (requests.ConnectionError, zipfile.BadZipFile, KeyError) as exc:
+                    log(f"[WARN] {year} 按需解压失败，改为下载整个压缩包: {exc}")
+                    validators = None
+                if validators is not None:
+                    finish_csv(year, csv_path, output_format, url, validators)
+                    return
+
+        if ext in (".zip", ".rar"):
+            validators = ranged_download(url, out_path)
+        else:
+            validators = download_file(url, out_path)
+        size_mb = out_path.stat().st_size / (1024 * 1024)
+        log(f"[SAVE] {year} -> {out_path} ({size_mb:.2f} MB)")
+
+        # 如果是压缩包则解压并删除
+        if ext in (".zip", ".rar"):
+            log(f"[EXT] {year} 解压缩中...")
+            if ext == ".zip":
+                with zipfile.ZipFile(out_path) as zip_ref:
+                    if len(zip_ref.infolist()) > 1:
+                        record_multi_member_zip(dest_dir, basename)
+            extract_archive(out_path, dest_dir)
+            if csv_path.exists():
+                finish_csv(year, csv_path, output_format, url, validators)
+            out_path.unlink(missing_ok=True)
+            log(f"[DEL ] {year} 已删除压缩文件")
+        else:
+            finish_csv(year, csv_path, output_format, url, validators)
+    except requests.HTTPError as http_err:
+        if http_err.response is not None and http_err.response.status_code == 404:
+            # 缓存的格式已失效：清除缓存，下次运行重新探测
+            update_ext_cache(dest_dir, basename, None)
+            record_probe_misses(dest_dir, basename, [ext])
+            log(f"[MISS] {year} 远端不存在 {ext}，已清除格式缓存")
             return
-        except error.HTTPError as http_err:
-            if getattr(http_err, 'code', None) == 404:
-                # 尝试下一种扩展名
-                print(f"[MISS] {year} 远端不存在 {ext}，尝试其它格式")
-                continue
-            raise
-        except Exception as exc:
-            print(f"[FAIL] {year} 下载失败: {exc}")
-            raise
-    # 如果所有格式都失败
-    print(f"[FAIL] {year} 未找到可用的下载格式 (.zip/.rar/.csv)")
+        raise
+    except Exception as exc:
+        log(f"[FAIL] {year} 下载失败: {exc}")
+        raise
 
 
 def parse_args() -> argparse.Namespace:
@@ -150,6 +593,18 @@ def parse_args() -> argparse.Namespace:
             "如提供则覆盖脚本内置 FILE_NAME_PART。"
         ),
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=DEFAULT_WORKERS,
+        help=f"并行下载的年份数（默认 {DEFAULT_WORKERS}）",
+    )
+    parser.add_argument(
+        "--format",
+        choices=("csv", "parquet"),
+        default="csv",
+        help="保存格式：csv（默认）或 parquet（解压后转为 zstd 压缩的 Parquet 并删除 CSV，需要 pyarrow）",
+    )
     return parser.parse_args()
 
 
@@ -159,16 +614,23 @@ def main() -> int:
     if args.start > args.end:
         print("起始年份不能大于结束年份", file=sys.stderr)
         return 2
+    if args.format == "parquet" and pq is None:
+        print("--format parquet 需要安装 pyarrow", file=sys.stderr)
+        return 2
 
     file_part = get_effective_file_part(args.filename)
     dest_dir = ensure_destination_dir(file_part)
     print(f"下载目录: {dest_dir}")
 
-    for year in range(args.start, args.end + 1):
-        try:
-            download_year(year, file_part, dest_dir)
-        except Exception as exc:  # noqa: BLE001 - 顶层输出错误信息
-            print(f"[FAIL] {year}: {exc}", file=sys.stderr)
+    # 各年份互不依赖，用线程池并行下载（重试与退避仍在 download_file 内部完成）
+    years = range(args.start, args.end + 1)
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as executor:
+        futures = {executor.submit(download_year, year, file_part, dest_dir, args.format): year for year in years}
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as exc:  # noqa: BLE001 - 顶层输出错误信息
+                log(f"[FAIL] {futures[future]}: {exc}", file=sys.stderr)
 
     return 0
 
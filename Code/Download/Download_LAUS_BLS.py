@@ -5,13 +5,93 @@ LAUS BLS 数据下载脚本
 数据保存到 Data/Original/LAUS/ 目录
 """
 
-import requests
+import asyncio
 import sys
 from pathlib import Path
 
+# 可选：aiohttp 并发下载多个年份（未安装时按顺序下载）
+try:
+    import aiohttp  # type: ignore
+except Exception:
+    aiohttp = None
+
 # 导入配置文件
 sys.path.append(str(Path(__file__).parent.parent))
 from config import get_data_dir, ensure_dir
+# 与其它下载脚本共享的会话（keep-alive 连接池）与读取块大小
+from _http import (
+    CHUNK_SIZE,
+    SESSION,
+    conditional_headers,
+    read_validators,
+    response_validators,
+    validators_match,
+    write_validators,
+)
+
+# 同时进行的下载数上限（并发模式下限制对服务器的压力）
+MAX_CONCURRENT = 4
+
+def download_file(url, file_path, year_str, headers, validators=None):
+    """流式下载单个文件到临时文件，完成后原子替换，中断不会留下损坏文件；远端返回 304 时跳过"""
+    print(f"[GET ] {year_str} <- {url}")
+    tmp_path = file_path.with_suffix(file_path.suffix + ".part")
+    try:
+        with SESSION.get(url, headers={**headers, **conditional_headers(validators)}, stream=True, timeout=30) as response:
+            # 服务器忽略条件请求头、仍返回 200 时，按响应的 ETag/Last-Modified 判断，未变化则不读取响应体
+            if response.status_code == 304 or (
+                response.status_code == 200 and validators and validators_match(validators, response.headers)
+            ):
+                print(f"[SKIP] {year_str} 远端未更新: {file_path}")
+            elif response.status_code == 200:
+                with open(tmp_path, "wb", buffering=CHUNK_SIZE) as f:
+                    for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                        f.write(chunk)
+                tmp_path.replace(file_path)
+                write_validators(file_path, response_validators(response.headers))
+                
+                # 获取文件大小
+                file_size_mb = file_path.stat().st_size / (1024 * 1024)
+                print(f"[SAVE] {year_str} -> {file_path} ({file_size_mb:.2f} MB)")
+            else:
+                print(f"[FAIL] {year_str} 下载失败 (状态码: {response.status_code})")
+    except Exception as e:
+        tmp_path.unlink(missing_ok=True)
+        print(f"[ERROR] {year_str} 下载出错: {e}")
+
+async def download_file_async(session, semaphore, url, file_path, year_str, validators=None):
+    """download_file 的异步版本，同时最多 MAX_CONCURRENT 个"""
+    tmp_path = file_path.with_suffix(file_path.suffix + ".part")
+    async with semaphore:
+        print(f"[GET ] {year_str} <- {url}")
+        try:
+            async with session.get(url, headers=conditional_headers(validators)) as response:
+                if response.status == 304 or (
+                    response.status == 200 and validators and validators_match(validators, response.headers)
+                ):
+                    print(f"[SKIP] {year_str} 远端未更新: {file_path}")
+                elif response.status == 200:
+                    with open(tmp_path, "wb", buffering=CHUNK_SIZE) as f:
+                        async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                            f.write(chunk)
+                    tmp_path.replace(file_path)
+                    write_validators(file_path, response_validators(response.headers))
+                    
+                    file_size_mb = file_path.stat().st_size / (1024 * 1024)
+                    print(f"[SAVE] {year_str} -> {file_path} ({file_size_mb:.2f} MB)")
+                else:
+                    print(f"[FAIL] {year_str} 下载失败 (状态码: {response.status})")
+        except Exception as e:
+            tmp_path.unlink(missing_ok=True)
+            print(f"[ERROR] {year_str} 下载出错: {e!r}")
+
+async def download_all_async(jobs, headers):
+    """在同一个 aiohttp 会话上并发下载 (url, file_path, year_str, validators) 任务"""
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT)
+    connector = aiohttp.TCPConnector(limit=MAX_CONCURRENT * 2, keepalive_timeout=60)
+    timeout = aiohttp.ClientTimeout(total=None, sock_connect=30, sock_read=30)
+    async with aiohttp.ClientSession(headers=headers, connector=connector, timeout=timeout) as session:
+        await asyncio.gather(*(download_file_async(session, semaphore, *job) for job in jobs))
 
 def download_laus_data(years=None, force_download=False):
     """
@@ -19,7 +99,8 @@ def download_laus_data(years=None, force_download=False):
     
     Args:
         years: 年份列表，如果为 None 则使用默认年份
-        force_download: 是否强制重新下载已存在的文件
+        force_download: 是否重新检查已存在的文件；有上次下载记录的 ETag/Last-Modified 时
+            发送条件请求，远端未更新（304）则跳过
     """
     # 默认年份（两位数格式）
     if years is None:
@@ -45,6 +126,7 @@ def download_laus_data(years=None, force_download=False):
         'Upgrade-Insecure-Requests': '1'
     }
     
+    jobs = []
     for year in years:
         # 格式化年份为两位数
         year_str = f"{year:02d}"
@@ -55,27 +137,20 @@ def download_laus_data(years=None, force_download=False):
         file_path = dest_dir / filename
         
         # 检查文件是否已存在
-        if file_path.exists() and not force_download:
-            print(f"[SKIP] {year_str} 文件已存在: {file_path}")
-            continue
+        validators = None
+        if file_path.exists():
+            if not force_download:
+                print(f"[SKIP] {year_str} 文件已存在: {file_path}")
+                continue
+            validators = read_validators(file_path)
         
-        print(f"[GET ] {year_str} <- {url}")
-        
-        try:
-            response = requests.get(url, headers=headers)
-            if response.status_code == 200:
-                # 保存文件
-                with open(file_path, "wb") as f:
-                    f.write(response.content)
-                
-                # 获取文件大小
-                file_size_mb = file_path.stat().st_size / (1024 * 1024)
-                print(f"[SAVE] {year_str} -> {file_path} ({file_size_mb:.2f} MB)")
-            else:
-                print(f"[FAIL] {year_str} 下载失败 (状态码: {response.status_code})")
-                
-        except Exception as e:
-            print(f"[ERROR] {year_str} 下载出错: {e}")
+        jobs.append((url, file_path, year_str, validators))
+    
+    if aiohttp is not None:
+        asyncio.run(download_all_async(jobs, headers))
+    else:
+        for url, file_path, year_str, validators in jobs:
+            download_file(url, file_path, year_str, headers, validators)
 
 def list_existing_files():
     """列出已存在的 LAUS 文件"""
@@ -1,8 +1,30 @@
+import asyncio
+import re
 import sys
 import time
 from pathlib import Path
 import requests
-import yaml
+
+# Shared with the other downloaders: pooled session, resumable GET, mtime-cached config parsing
+from _http import (
+    CHUNK_SIZE,
+    discard_part,
+    get_with_resume,
+    if_range_value,
+    load_config,
+    read_part_validators,
+    response_validators,
+    write_part_validators,
+)
+
+# Optional: aiohttp downloads the years concurrently (sequential requests otherwise)
+try:
+    import aiohttp  # type: ignore
+except Exception:
+    aiohttp = None
+
+# Concurrent downloads allowed at once; bounds the load on the server in place of a per-file sleep
+MAX_CONCURRENT = 4
 
 def load_paths() -> tuple[Path, str, str]:
     """Loads required paths and URL patterns from the config.yaml file."""
@@ -11,8 +33,7 @@ def load_paths() -> tuple[Path, str, str]:
     if not config_path.exists():
         sys.exit(f"ERROR: Configuration file not found at {config_path}")
 
-    with config_path.open("r", encoding="utf-8") as f:
-        cfg = yaml.safe_load(f)
+    cfg = load_config(config_path)
 
     try:
         pnsp_config = cfg["data_sources"]["usgs_pnsp"]
@@ -29,13 +50,9 @@ def load_paths() -> tuple[Path, str, str]:
 
 def download_file(url: str, destination: Path):
     """Downloads a file from a URL to a specified destination."""
+    # Writes to a .part file and renames on success; a .part left by an interrupted run is resumed next time
     try:
-        response = requests.get(url, stream=True, timeout=30)
-        response.raise_for_status()  # Raise an exception for bad status codes (4xx or 5xx)
-
-        with open(destination, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                f.write(chunk)
+        get_with_resume(url, destination)
         print(f"  -> Successfully saved to {destination.name}")
         return True
     except requests.exceptions.HTTPError as e:
@@ -44,6 +61,80 @@ def download_file(url: str, destination: Path):
         print(f"  -> FAILED. Error downloading {url}: {e}")
     return False
 
+async def download_file_async(session, semaphore: asyncio.Semaphore, url: str, destination: Path) -> bool:
+    """Asynchronous counterpart of download_file; at most MAX_CONCURRENT run at once.
+
+    Resumes from an existing .part file the same way get_with_resume does (Range plus If-Range, using the
+    validators saved next to the .part), and keeps the .part on failure so the next run can continue it.
+    """
+    tmp_path = destination.with_suffix(destination.suffix + ".part")
+    validators = read_part_validators(tmp_path)
+    async with semaphore:
+        try:
+            # A second pass only happens when the server rejects the resume offset (416) and the .part is dropped
+            for _ in range(2):
+                pos = tmp_path.stat().st_size if tmp_path.exists() else 0
+                if_range = if_range_value(validators)
+                if pos and if_range is None:
+                    # Without a saved ETag/Last-Modified the .part may belong to an older version of the file
+                    print(f"  -> Discarding {tmp_path.name}: no saved ETag/Last-Modified to resume against")
+                    discard_part(tmp_path)
+                    pos = 0
+                headers = {"Accept-Encoding": "identity"}
+                if pos:
+                    headers["Range"] = f"bytes={pos}-"
+                    headers["If-Range"] = if_range
+                async with session.get(url, headers=headers) as response:
+                    if pos and response.status == 416:
+                        discard_part(tmp_path)
+                        continue
+                    response.raise_for_status()
+                    resume = pos > 0 and response.status == 206
+                    if resume:
+                        # Content-Range: bytes <start>-<end>/<total>; the start must match the end of the .part
+                        match = re.match(r"bytes (\d+)-\d+/(\d+|\*)", response.headers.get("Content-Range", ""))
+                        if match is None or int(match.group(1)) != pos:
+                            discard_part(tmp_path)
+                            raise aiohttp.ClientPayloadError(f"Content-Range does not match the partial file: {url}")
+                        expected = int(match.group(2)) if match.group(2) != "*" else None
+                        print(f"  -> Resuming {destination.name} from {pos / (1024 * 1024):.2f} MB")
+                    else:
+                        # Record which version the new .part belongs to before writing any of it
+                        validators = response_validators(response.headers)
+                        write_part_validators(tmp_path, validators)
+                        expected = response.content_length
+                    # Append after a 206; a 200 means the server sent the whole file, so start the .part over
+                    with open(tmp_path, 'ab' if resume else 'wb', buffering=CHUNK_SIZE) as f:
+                        async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                            f.write(chunk)
+                if expected is not None and tmp_path.stat().st_size != expected:
+                    raise aiohttp.ClientPayloadError(
+                        f"Incomplete download: {tmp_path.stat().st_size} / {expected} bytes: {url}"
+                    )
+                tmp_path.replace(destination)
+                discard_part(tmp_path)
+                print(f"  -> Successfully saved to {destination.name}")
+                return True
+            print(f"  -> FAILED. Server rejected the resume offset for URL: {url}")
+        except aiohttp.ClientResponseError as e:
+            print(f"  -> FAILED. HTTP Error: {e.status} for URL: {url}")
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"  -> FAILED. Error downloading {url}: {e!r}")
+        except Exception as e:  # noqa: BLE001 - one failed year must not abort the other downloads
+            print(f"  -> FAILED. Unexpected error downloading {url}: {e!r}")
+    return False
+
+async def download_all_async(jobs: list[tuple[str, Path]]) -> None:
+    """Downloads (url, destination) jobs concurrently over one pooled aiohttp session."""
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT)
+    connector = aiohttp.TCPConnector(limit=MAX_CONCURRENT * 2, keepalive_timeout=60)
+    timeout = aiohttp.ClientTimeout(total=None, sock_connect=30, sock_read=30)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        await asyncio.gather(
+            *(download_file_async(session, semaphore, url, path) for url, path in jobs),
+            return_exceptions=True,
+        )
+
 def main():
     """Main function to download PNSP data for the specified years."""
     output_dir, base_url, filename_pattern = load_paths()
@@ -53,6 +144,7 @@ def main():
     print(f"Starting download of PNSP data from {start_year} to {end_year}.")
     print(f"Files will be saved in: {output_dir}\n")
 
+    jobs = []
     for year in range(start_year, end_year + 1):
         filename = filename_pattern.format(year=year)
         file_url = f"{base_url}{filename}"
@@ -65,11 +157,16 @@ def main():
             print(f"  -> File already exists. Skipping.")
             continue
 
-        download_file(file_url, output_path)
-        time.sleep(1)  # Be polite to the server
+        jobs.append((file_url, output_path))
+
+    if aiohttp is not None:
+        asyncio.run(download_all_async(jobs))
+    else:
+        for file_url, output_path in jobs:
+            download_file(file_url, output_path)
+            time.sleep(1)  # Be polite to the server
 
     print("\nDownload process completed.")
 
 if __name__ == "__main__":
     main()
-
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Download 脚本共用的 HTTP 会话、断点续传下载与配置读取
+- SESSION 在同一进程内共享：多个下载脚本串联运行时复用同一连接池与 TLS 会话
+- get_with_resume(url, dest_path) 流式写入 .part，中断后按 Range + If-Range 续传，完成后原子替换
+- load_config(config_path) 按 mtime 缓存解析结果，config.yaml 未修改时不重复解析
+- read_validators/write_validators 读写 {文件名}.etag.json，重复运行时据此判断远端文件是否变化
+"""
+
+import json
+import os
+import pickle
+import re
+import threading
+import time
+from functools import lru_cache
+from pathlib import Path
+
+import requests
+import yaml
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# 流式下载的读取块与文件写缓冲大小
+CHUNK_SIZE = 1024 * 1024
+
+# 进程内共享的会话：连接池容纳 EPA 并行下载的全部连接（8 线程 x 4 段）；
+# 502/503/504 与连接错误由适配器按指数退避自动重试
+SESSION = requests.Session()
+_adapter = HTTPAdapter(
+    pool_connections=32,
+    pool_maxsize=32,
+    max_retries=Retry(total=3, backoff_factor=2, status_forcelist=(502, 503, 504)),
+)
+SESSION.mount("https://", _adapter)
+SESSION.mount("http://", _adapter)
+
+# 校验信息旁路文件后缀：{文件名}.etag.json 记录 ETag/Last-Modified/大小
+VALIDATORS_SUFFIX = ".etag.json"
+
+# PyYAML 编译了 libyaml 时使用 C 实现的加载器，否则退回纯 Python 实现
+YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+# 多线程下载时保证每行日志完整输出
+_print_lock = threading.Lock()
+
+
+def log(*args, **kwargs) -> None:
+    with _print_lock:
+        print(*args, **kwargs)
+
+
+def advise_sequential(f) -> None:
+    # 提示内核该文件按顺序读写（加大预读、尽早回收已写页）；没有 posix_fadvise 的平台（如 Windows、macOS）跳过
+    if hasattr(os, "posix_fadvise"):
+        os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+
+
+def get_with_resume(url: str, dest_path: Path, retries: int = 3, backoff_seconds: float = 2.0) -> dict[str, str | None]:
+    # 流式下载到 dest_path，返回远端的 ETag/Last-Modified
+    # 使用临时文件，成功后原子替换，避免中断产生损坏文件；中断留下的 .part 会在重试或下次运行时续传
+    tmp_path = dest_path.with_suffix(dest_path.suffix + ".part")
+    # 上次运行留下的 .part 连同开始下载时记录的校验信息一起续传
+    validators = read_part_validators(tmp_path)
+    for attempt in range(1, retries + 1):
+        try:
+            # 续传时只请求缺失部分；If-Range 保证远端文件未变化，否则服务器返回完整文件
+            # identity 编码保证 Range 偏移与落盘字节一一对应
+            pos = tmp_path.stat().st_size if tmp_path.exists() else 0
+            if_range = if_range_value(validators)
+            if pos and if_range is None:
+                # 没有校验信息无法确认片段与远端是同一版本，拼接可能得到损坏文件，丢弃后重新下载
+                log(f"[PART] {dest_path.name} 片段缺少 ETag/Last-Modified 记录，重新下载")
+                discard_part(tmp_path)
+                pos = 0
+            headers = {"Accept-Encoding": "identity"}
+            if pos:
+                headers["Range"] = f"bytes={pos}-"
+                headers["If-Range"] = if_range
+            with SESSION.get(url, stream=True, timeout=30, headers=headers) as resp:
+                if pos and resp.status_code == 416:
+                    # 本地片段与远端不一致（如远端文件变短），丢弃后重新下载
+                    discard_part(tmp_path)
+                    raise requests.ConnectionError(f"续传位置无效，重新下载: {url}", response=resp)
+                resp.raise_for_status()
+                resume = pos > 0 and resp.status_code == 206
+                if resume:
+                    # Content-Range: bytes <start>-<end>/<total>，起点必须与本地片段末尾一致
+                    match = re.match(r"bytes (\d+)-\d+/(\d+|\*)", resp.headers.get("Content-Range", ""))
+                    if match is None or int(match.group(1)) != pos:
+                        discard_part(tmp_path)
+                        raise requests.ConnectionError(f"续传范围不匹配，重新下载: {url}", response=resp)
+                    expected = int(match.group(2)) if match.group(2) != "*" else None
+                    log(f"[RESUME] {dest_path.name} 从 {pos / (1024 * 1024):.2f} MB 处续传")
+                else:
+                    # 从头下载：先记录本次响应的校验信息，中断后才能安全续传
+                    validators = response_validators(resp.headers)
+                    write_part_validators(tmp_path, validators)
+                    length = resp.headers.get("Content-Length")
+                    expected = int(length) if length is not None else None
+                with tmp_path.open("ab" if resume else "wb", buffering=CHUNK_SIZE) as out:
+                    advise_sequential(out)
+                    # 流式写入，避免大文件占用内存
+                    for chunk in resp.iter_content(chunk_size=CHUNK_SIZE):
+                        out.write(chunk)
+            # 与 Content-Length 核对，连接提前断开时保留片段并重试续传
+            if expected is not None and tmp_path.stat().st_size != expected:
+                raise requests.ConnectionError(
+                    f"下载不完整: {tmp_path.stat().st_size} / {expected} 字节: {url}"
+                )
+            tmp_path.replace(dest_path)
+            discard_part(tmp_path)
+            return validators
+        except requests.RequestException as exc:
+            # 404 表示文件不存在，直接交给调用方处理，不必重试
+            response = getattr(exc, "response", None)
+            if response is not None and response.status_code == 404:
+                raise
+            if attempt < retries:
+                time.sleep(backoff_seconds * attempt)
+            else:
+                raise
+
+
+def response_validators(headers) -> dict[str, str | None]:
+    # 从响应头（requests 或 aiohttp）取出 ETag/Last-Modified
+    return {"etag": headers.get("ETag"), "last_modified": headers.get("Last-Modified")}
+
+
+def part_validators_path(tmp_path: Path) -> Path:
+    # .part 片段的校验信息旁路文件：{文件名}.part.etag.json
+    return tmp_path.with_name(tmp_path.name + VALIDATORS_SUFFIX)
+
+
+def read_part_validators(tmp_path: Path) -> dict[str, str | None]:
+    # 读取开始下载 .part 时记录的 ETag/Last-Modified；缺失或损坏时返回空记录
+    try:
+        info = json.loads(part_validators_path(tmp_path).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        info = {}
+    return {"etag": info.get("etag"), "last_modified": info.get("last_modified")}
+
+
+def write_part_validators(tmp_path: Path, validators: dict[str, str | None]) -> None:
+    # 记录 .part 对应的远端版本；远端两者都未提供时删除旧记录，使该片段不会被续传
+    path = part_validators_path(tmp_path)
+    if validators.get("etag") or validators.get("last_modified"):
+        path.write_text(json.dumps(validators), encoding="utf-8")
+    else:
+        path.unlink(missing_ok=True)
+
+
+def discard_part(tmp_path: Path) -> None:
+    # 删除 .part 片段及其校验信息
+    tmp_path.unlink(missing_ok=True)
+    part_validators_path(tmp_path).unlink(missing_ok=True)
+
+
+def if_range_value(validators: dict | None) -> str | None:
+    # If-Range 只能使用强 ETag，弱 ETag（W/ 前缀）时改用 Last-Modified；都没有时不能安全续传
+    if not validators:
+        return None
+    etag = validators.get("etag")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return validators.get("last_modified")
+
+
+def read_validators(path: Path) -> dict | None:
+    # 读取 {文件名}.etag.json；旁路文件缺失、损坏或记录的大小与本地文件不符时返回 None
+    try:
+        info = json.loads(path.with_name(path.name + VALIDATORS_SUFFIX).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    if not path.exists() or path.stat().st_size != info.get("size"):
+        return None
+    return info
+
+
+def write_validators(path: Path, validators: dict[str, str | None], url: str | None = None) -> None:
+    # 记录 ETag/Last-Modified、本地文件大小以及（可选的）下载来源；远端两者都未提供时不写
+    if not (validators.get("etag") or validators.get("last_modified")):
+        return
+    info = {**validators, "size": path.stat().st_size}
+    if url is not None:
+        info["url"] = url
+    path.with_name(path.name + VALIDATORS_SUFFIX).write_text(json.dumps(info, indent=2), encoding="utf-8")
+
+
+def conditional_headers(validators: dict | None) -> dict[str, str]:
+    # 根据校验信息生成 If-None-Match/If-Modified-Since 请求头
+    headers = {}
+    if validators:
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
+    return headers
+
+
+def validators_match(saved: dict, headers) -> bool:
+    # 不少服务器/CDN 会忽略条件请求头、总是返回 200，此时用响应中的 ETag（忽略弱标记 W/）或 Last-Modified 与记录比较；
+    # 两者都无法比较时视为已变化
+    current = response_validators(headers)
+    if saved.get("etag") and current["etag"]:
+        return saved["etag"].removeprefix("W/") == current["etag"].removeprefix("W/")
+    if saved.get("last_modified") and current["last_modified"]:
+        return saved["last_modified"] == current["last_modified"]
+    return False
+
+
+def load_config(config_path: Path) -> dict:
+    # 以 (路径, mtime) 为键缓存；config.yaml 修改后 mtime 变化，自动重新读取
+    return _load_config(config_path.resolve(), config_path.stat().st_mtime_ns)
+
+
+@lru_cache(maxsize=4)
+def _load_config(config_path: Path, mtime_ns: int) -> dict:
+    # 跨进程再用旁边的 .pkl 缓存：其 mtime 不早于 yaml 时直接反序列化
+    cache_path = config_path.with_suffix(".pkl")
+    try:
+        if cache_path.stat().st_mtime_ns >= mtime_ns:
+            with cache_path.open("rb") as f:
+                return pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        pass
+
+    with config_path.open("r", encoding="utf-8") as f:
+        cfg = yaml.load(f, Loader=YAML_LOADER)
+
+    # 先写临时文件再替换，避免并发读取到不完整的缓存；目录不可写时跳过缓存
+    tmp_path = cache_path.with_suffix(".pkl.tmp")
+    try:
+        with tmp_path.open("wb") as f:
+            pickle.dump(cfg, f, protocol=pickle.HIGHEST_PROTOCOL)
+        tmp_path.replace(cache_path)
+    except OSError:
+        tmp_path.unlink(missing_ok=True)
+    return cfg